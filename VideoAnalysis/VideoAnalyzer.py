@@ -5,6 +5,7 @@ import cv2
 import numpy as np
 from tensorflow.keras.models import load_model 
 from tensorflow.keras.preprocessing.image import img_to_array
+from metrics import timed, count_error, count_fallback
 
 warnings.filterwarnings("ignore")
 
@@ -35,21 +36,24 @@ def analyze_video_frame(base64_frame: str) -> str:
     Analyzes a single Base64-encoded frame to detect the dominant emotion.
     """
     if not FACE_CLASSIFIER or not VIDEO_CLASSIFIER:
+        count_fallback('video_model_unavailable')
         return 'Model Error'
 
     try:
         # 1. Decode Base64 string into NumPy array (image)
-        base64_decoded = base64_frame.split(',')[1]
-        img_bytes = base64.b64decode(base64_decoded)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with timed('video_decode'):
+            base64_decoded = base64_frame.split(',')[1]
+            img_bytes = base64.b64decode(base64_decoded)
+            nparr = np.frombuffer(img_bytes, np.uint8)
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
         if frame is None:
             return 'Neutral'
 
         # 2. Preprocess
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = FACE_CLASSIFIER.detectMultiScale(gray, 1.3, 5)
+        with timed('face_detection'):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = FACE_CLASSIFIER.detectMultiScale(gray, 1.3, 5)
         
         if len(faces) == 0:
             return 'Neutral' 
@@ -73,7 +77,8 @@ def analyze_video_frame(base64_frame: str) -> str:
             roi = np.expand_dims(roi, axis=-1) 
             roi = np.expand_dims(roi, axis=0)
 
-            prediction = VIDEO_CLASSIFIER.predict(roi, verbose=0)[0]
+            with timed('video_predict'):
+                prediction = VIDEO_CLASSIFIER.predict(roi, verbose=0)[0]
             
             # Determine Dominant Emotion
             label_index = prediction.argmax()
@@ -86,5 +91,6 @@ def analyze_video_frame(base64_frame: str) -> str:
         return 'Neutral'
 
     except Exception as e:
+        count_error('video_analysis')
         print(f"Video analysis exception: {e}")
         return 'Analysis Error'
\ No newline at end of file
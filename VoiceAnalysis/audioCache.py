@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics import REGISTRY
+
+# --- CONFIGURATION ---
+CACHE_MAX_ENTRIES = int(os.environ.get('AUDIO_CACHE_MAX_ENTRIES', '512'))
+CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get('AUDIO_CACHE_TTL', '300'))  # seconds
+
+CACHE_EVENTS = REGISTRY.counter('evta_audio_cache_total', 'Audio result cache lookups by outcome.')
+
+
+def content_key(audio_blob):
+    """Content address of a blob: identical bytes -> identical key, whatever the socket/session."""
+    return hashlib.blake2b(audio_blob, digest_size=20).hexdigest()
+
+
+def _result_size(key, result):
+    """Rough memory footprint of one cache entry (key + result dict + its strings)."""
+    return sys.getsizeof(key) + sys.getsizeof(result) + sum(
+        sys.getsizeof(k) + sys.getsizeof(v) for k, v in result.items()
+    )
+
+
+class _InFlight:
+    """A computation other callers with the same key can wait on."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class AudioResultCache:
+    """
+    Bounded, content-addressed LRU cache (entry count + memory cap + TTL) for analysis results,
+    with in-flight coalescing: concurrent submissions of the same bytes share one computation.
+    Exceptions are never cached; every waiter of a failed computation gets the exception.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._in_flight = {}           # key -> _InFlight
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, audio_blob, compute):
+        key = content_key(audio_blob)
+
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                CACHE_EVENTS.inc(outcome='hit')
+                return dict(cached)
+            pending = self._in_flight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._in_flight[key] = _InFlight()
+
+        if not owner:
+            CACHE_EVENTS.inc(outcome='coalesced')
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return dict(pending.result)
+
+        CACHE_EVENTS.inc(outcome='miss')
+        try:
+            result = compute(audio_blob)
+            pending.result = result
+            with self._lock:
+                self._store(key, result)
+            return dict(result)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            pending.done.set()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, result = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            CACHE_EVENTS.inc(outcome='expired')
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _store(self, key, result):
+        size = _result_size(key, result)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (time.monotonic() + self.ttl, size, result)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            CACHE_EVENTS.inc(outcome='evicted')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'in_flight': len(self._in_flight)}
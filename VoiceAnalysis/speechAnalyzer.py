@@ -2,9 +2,10 @@ import os
 import io
 import numpy as np
 import librosa
-import soundfile as sf
 from pydub import AudioSegment
 from transformers import pipeline
+from metrics import timed, count_error, count_fallback
+from VoiceAnalysis.audioCache import AudioResultCache
 
 try:
     if os.name == 'nt': # Check if system is Windows
@@ -15,7 +16,18 @@ except Exception as e:
     print(f"Could not set TMPDIR: {e}")
 # --- CONFIGURATION ---
 RATE = 16000
-SEGMENT_DURATION = 1.0  # seconds
+SEGMENT_DURATION = 1.5  # seconds, SER window length
+SEGMENT_OVERLAP = 0.25  # fraction of a window shared with the next one
+
+# Energy-based voice activity detection for the SER loop
+VAD_FRAME_DURATION = 0.02   # seconds per energy frame
+VAD_DYNAMIC_RANGE_DB = 35.0 # frames this far below the loudest frame count as silence
+VAD_FLOOR_DB = -55.0        # frames below this absolute level always count as silence
+MAX_SPEECH_GAP = 0.3        # seconds; shorter pauses are merged into the surrounding speech
+MIN_SPEECH_DURATION = 0.25  # seconds; shorter speech regions are ignored
+
+# Content-addressed result cache (see audioCache.py for AUDIO_CACHE_* settings)
+AUDIO_CACHE = AudioResultCache()
 
 # --- GLOBAL MODEL INITIALIZATION ---
 SER_PIPELINE = None
@@ -38,100 +50,169 @@ except Exception as e:
     SER_PIPELINE = None
     STT_PIPELINE = None
 
+# --- SEGMENTATION ---
+def map_emotion_group(raw_label):
+    """Maps a SER model label onto the user's sentiment groups."""
+    raw_label = raw_label.lower()
+    if "angry" in raw_label or "disgust" in raw_label:
+        return "angry"
+    if "happy" in raw_label or "surprise" in raw_label:
+        return "happy"
+    if "sad" in raw_label or "fear" in raw_label:
+        return "sad"
+    return "neutral"
+
+
+def frame_energy(y, frame_samples):
+    """RMS energy per non-overlapping frame (the last partial frame included)."""
+    num_frames = int(np.ceil(len(y) / frame_samples))
+    padded = np.zeros(num_frames * frame_samples, dtype=np.float32)
+    padded[:len(y)] = y
+    return np.sqrt(np.mean(padded.reshape(num_frames, frame_samples) ** 2, axis=1))
+
+
+def segment_speech(y, sr):
+    """
+    Energy-based VAD + windowing for the SER loop.
+    Returns (start, end, rms) sample windows of ~SEGMENT_DURATION covering only the speech
+    regions, with SEGMENT_OVERLAP between consecutive windows. Silence is skipped and
+    regions shorter than MIN_SPEECH_DURATION (e.g. clicks, tiny tails) are dropped.
+    """
+    frame_samples = max(1, int(VAD_FRAME_DURATION * sr))
+    energy = frame_energy(y, frame_samples)
+    if energy.size == 0 or energy.max() <= 0:
+        return []
+
+    # Speech = frames within VAD_DYNAMIC_RANGE_DB of the loudest frame and above the absolute floor
+    energy_db = 20 * np.log10(np.maximum(energy, 1e-10))
+    threshold_db = max(energy_db.max() - VAD_DYNAMIC_RANGE_DB, VAD_FLOOR_DB)
+    is_speech = energy_db > threshold_db
+    if not is_speech.any():
+        return []
+
+    # Speech regions as [start, end) frame indices
+    edges = np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    # Bridge short pauses so one utterance is not split into many tiny regions
+    max_gap = int(MAX_SPEECH_GAP / VAD_FRAME_DURATION)
+    regions = [[starts[0], ends[0]]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - regions[-1][1] <= max_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    window = int(SEGMENT_DURATION * sr)
+    hop = max(1, int(window * (1 - SEGMENT_OVERLAP)))
+    min_samples = int(MIN_SPEECH_DURATION * sr)
+    windows = []
+    for start_frame, end_frame in regions:
+        region_start = start_frame * frame_samples
+        region_end = min(end_frame * frame_samples, len(y))
+        if region_end - region_start < min_samples:
+            continue
+        if region_end - region_start <= window:
+            bounds = [(region_start, region_end)]
+        else:
+            # Regular hops; a significant uncovered tail gets its own end-aligned window,
+            # a small one is absorbed by stretching the last window to the region end
+            offsets = list(range(region_start, region_end - window + 1, hop))
+            bounds = [(offset, offset + window) for offset in offsets]
+            tail = region_end - bounds[-1][1]
+            if tail > hop // 2:
+                bounds.append((region_end - window, region_end))
+            elif tail > 0:
+                bounds[-1] = (bounds[-1][0], region_end)
+        for start, end in bounds:
+            segment = y[start:end]
+            windows.append((start, end, float(np.sqrt(np.mean(segment ** 2)))))
+    return windows
+
+
 # --- CORE ANALYSIS FUNCTION ---
+def _run_audio_analysis(audio_blob):
+    """
+    Decodes the blob and runs STT + SER. Raises on decoding/model failures so that
+    errors are never stored in the result cache.
+    """
+    # 1. CRITICAL DECODING STEP: Convert compressed WebM blob using pydub/ffmpeg
+    with timed('ffmpeg_decode'):
+        audio_file = io.BytesIO(audio_blob)
+        audio_segment = AudioSegment.from_file(audio_file, format="webm")
+    
+    if len(audio_segment) < 100: 
+        return {'transcription': 'Recording too short or silent. Speak clearly.', 'emotion': 'Neutral'} 
+
+    # --- SPEECH-TO-TEXT (STT) ---
+    # Prepare audio segment for the STT pipeline
+    with timed('stt'):
+        stt_buffer = io.BytesIO()
+        audio_segment.export(stt_buffer, format="wav") # Export segment to WAV buffer
+        stt_buffer.seek(0)
+
+        # Perform STT on the whole segment
+        stt_result = STT_PIPELINE(stt_buffer.read())
+    transcribed_text = stt_result['text'].strip() if stt_result and 'text' in stt_result else 'Could not transcribe.'
+    
+    # --- EMOTION RECOGNITION (SER) ---
+    # Convert pydub segment to numpy array and normalize
+    y = np.array(audio_segment.get_array_of_samples(), dtype=np.int16)
+    y = y.astype(np.float32) / (2**15) # Normalize
+    sr = audio_segment.frame_rate
+
+    # Resample if necessary
+    if sr != RATE:
+        with timed('resample'):
+            y = librosa.resample(y, orig_sr=sr, target_sr=RATE)
+        sr = RATE
+
+    # 3. Segment (speech only) and Predict
+    windows = segment_speech(y, sr)
+    emotions_score = {"angry": 0.0, "happy": 0.0, "neutral": 0.0, "sad": 0.0}
+    peak_energy = max((energy for _, _, energy in windows), default=0.0)
+
+    for start, end, energy in windows:
+        # Pass the 1-D float32 window straight to the pipeline (no WAV encode/decode round trip).
+        # transformers 4.30 only accepts str/bytes/np.ndarray here and assumes the model's rate (RATE).
+        with timed('ser'):
+            result = SER_PIPELINE(y[start:end])
+
+        # Vote with the model's confidence for every returned label, scaled by how loud the window is
+        energy_weight = energy / peak_energy if peak_energy > 0 else 1.0
+        for prediction in result:
+            emotions_score[map_emotion_group(prediction['label'])] += prediction['score'] * energy_weight
+
+    # 4. Determine Dominant Emotion and Transcription Placeholder
+    dominant_emotion = max(emotions_score, key=emotions_score.get) if windows else 'Neutral'
+    return {
+        'transcription': transcribed_text,
+        'emotion': dominant_emotion.capitalize()
+    }
+
+
 def analyze_audio_blob(audio_blob):
     """
     Accepts raw audio data (blob) and returns the dominant emotion and a placeholder transcription.
     Requires FFmpeg to be installed on the system PATH.
+    Results are cached by blob content, so resent/duplicate blobs skip decoding, STT and SER.
     """
-    global SER_PIPELINE, STT_PIPELINE, RATE, SEGMENT_DURATION
-    
     if not SER_PIPELINE or not STT_PIPELINE:
+        count_fallback('speech_model_unavailable')
         return {'transcription': 'Speech models failed to load. Check dependencies or Try Again.', 'emotion': 'Neutral'}
 
     if not audio_blob:
         return {'transcription': '', 'emotion': 'Neutral'}
 
     try:
-        if audio_blob:
-
-            # 1. CRITICAL DECODING STEP: Convert compressed WebM blob using pydub/ffmpeg
-            audio_file = io.BytesIO(audio_blob)
-            audio_segment = AudioSegment.from_file(audio_file, format="webm")
-            
-            if len(audio_segment) < 100: 
-                return {'transcription': 'Recording too short or silent. Speak clearly.', 'emotion': 'Neutral'} 
-        
-            # --- SPEECH-TO-TEXT (STT) ---
-            # Prepare audio segment for the STT pipeline
-            stt_buffer = io.BytesIO()
-            audio_segment.export(stt_buffer, format="wav") # Export segment to WAV buffer
-            stt_buffer.seek(0)
-                
-            # Perform STT on the whole segment
-            stt_result = STT_PIPELINE(stt_buffer.read())
-            transcribed_text = stt_result['text'].strip() if stt_result and 'text' in stt_result else 'Could not transcribe.'
-            
-            # --- EMOTION RECOGNITION (SER) ---
-            # Convert pydub segment to numpy array and normalize
-            y = np.array(audio_segment.get_array_of_samples(), dtype=np.int16)
-            y = y.astype(np.float32) / (2**15) # Normalize
-            sr = audio_segment.frame_rate
-
-            # Resample if necessary
-            if sr != RATE:
-                y = librosa.resample(y, orig_sr=sr, target_sr=RATE)
-                sr = RATE
-
-            total_samples = len(y)
-            segment_samples = int(SEGMENT_DURATION * sr)
-
-            emotions_count = {"angry": 0, "happy": 0, "neutral": 0, "sad": 0}
-            num_segments = 0
-
-            # 3. Segment and Predict
-            for start in range(0, total_samples, segment_samples):
-                end = min(start + segment_samples, total_samples)
-                segment = y[start:end]
-
-                if len(segment) == 0:
-                    continue 
-
-                # Convert float32 NumPy segment back to int16 for WAV buffer
-                segment_int16 = (segment * (2**15)).astype(np.int16) 
-
-                buffer = io.BytesIO()
-                sf.write(buffer, segment_int16, sr, format='wav')
-                buffer.seek(0)
-                
-                # Predict
-                result = SER_PIPELINE(buffer.read())
-
-                raw_label = result[0]['label'].lower()
-
-                # Mapping user's sentiment groups
-                if "angry" in raw_label or "disgust" in raw_label:
-                    emotions_count["angry"] += 1
-                elif "happy" in raw_label or "surprise" in raw_label:
-                    emotions_count["happy"] += 1
-                elif "sad" in raw_label or "fear" in raw_label:
-                    emotions_count["sad"] += 1
-                else:
-                    emotions_count["neutral"] += 1
-
-                num_segments += 1
-            
-            # 4. Determine Dominant Emotion and Transcription Placeholder
-            dominant_emotion = max(emotions_count, key=emotions_count.get) if num_segments > 0 else 'Neutral'
-            return {
-                'transcription': transcribed_text,
-                'emotion': dominant_emotion.capitalize()
-            }
-        else:
-            return {'transcription': 'No audio data received.', 'emotion': 'Neutral'}
-    
+        if isinstance(audio_blob, (bytes, bytearray, memoryview)):
+            return AUDIO_CACHE.get_or_compute(audio_blob, _run_audio_analysis)
+        return _run_audio_analysis(audio_blob)
+
     except FileNotFoundError:
+        count_fallback('ffmpeg_missing')
         return {'transcription': 'Error: FFmpeg not found on PATH. Audio decoding failed.', 'emotion': 'Alert'}
     except Exception as e:
+        count_error('audio_analysis')
         print(f"Audio analysis failed during processing: {e}")
-        return {'transcription': f'Audio input error: {e}.', 'emotion': 'Neutral'}
\ No newline at end of file
+        return {'transcription': f'Audio input error: {e}.', 'emotion': 'Neutral'}
@@ -1,18 +1,26 @@
 import time 
 import os
-from flask import Flask, jsonify, request, session, redirect, url_for, render_template, g 
+import math
+from flask import Flask, jsonify, request, session, redirect, url_for, render_template, g, Response, send_from_directory
 from flask_socketio import SocketIO, emit
 from flask_dance.contrib.google import make_google_blueprint, google
 from flask_dance.contrib.github import make_github_blueprint, github
 from dotenv import load_dotenv
-from database import db, User, Conversation, Message
+from database import db, User, Conversation, Message, backfill_preferences
 from werkzeug.security import check_password_hash
 from datetime import datetime
+from metrics import REGISTRY, RECENT_PROFILES, timed, timed_event, count_fallback
 
 # --- EXTERNAL MODULE IMPORTS ---
 from groqChatbot import llm_chatbot 
+from speculativePrefetch import SpeculativePrefetcher, is_candidate
 from VoiceAnalysis.speechAnalyzer import analyze_audio_blob 
 from VideoAnalysis.VideoAnalyzer import analyze_video_frame
+from emotionTelemetry import emotion_telemetry, session_timeline, user_summary, SOURCES
+from jobQueue import job_queue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from dataPipeline import export_ndjson, user_filters
+from profileCache import profile_cache
+from rateLimiter import admission_control, ADMITTED, SHED
 # ---
 
 # Set this environment variable for local testing with HTTP
@@ -25,8 +33,8 @@ load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'a-default-secret-key')
 
-# Configure SQLite database
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+# Configure SQLite database (DATABASE_URL lets benchmarks/tests point at a scratch DB)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database with the app.py
@@ -36,11 +44,29 @@ db.init_app(app)
 # Using eventlet for asynchronous support for real-time video/audio streams
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+# Opt-in (SPECULATIVE_PREFETCH=1): start the LLM reply while the student reviews the transcription
+speculative_prefetcher = SpeculativePrefetcher(llm_chatbot)
+
+# Audio blobs above this size are analyzed by the background job queue
+LARGE_AUDIO_BYTES = int(os.environ.get('LARGE_AUDIO_BYTES', str(1024 * 1024)))
+EXPORT_DIR = os.path.join(app.instance_path, 'exports')
+os.makedirs(EXPORT_DIR, exist_ok=True)
+
+# Admission control: queued background audio jobs count as audio load
+admission_control.add_load_source('audio_stream', lambda: job_queue.depth('default'))
+# Last facial emotion per Socket.IO client, re-sent when a frame is throttled or downsampled
+last_video_emotion = {}
+# Per Socket.IO client: (user_id, conversation_id sent, conversation_id allowed or None)
+socket_conversations = {}
+
 # Function to create database tables
 def create_db():
     with app.app_context():
         db.create_all()
         print("Database tables created!")
+        migrated = backfill_preferences()
+        if migrated:
+            print(f"Migrated {migrated} legacy likes/dislikes lists to UserPreference rows.")
 
 # Configure Flask-Dance blueprints
 # google_bp = make_google_blueprint(
@@ -68,6 +94,34 @@ def get_current_user():
         return User.query.get(user_id)
     return None
 
+def get_socket_conversation_id(data):
+    """
+    Reads the optional conversation_id sent alongside Socket.IO stream events.
+    Returns None unless it belongs to the logged-in user; the check runs once per sid and id.
+    """
+    try:
+        conversation_id = int(data.get('conversation_id'))
+    except (TypeError, ValueError):
+        return None
+
+    user_id = session.get('user_id')
+    cached = socket_conversations.get(request.sid)
+    if cached and cached[:2] == (user_id, conversation_id):
+        return cached[2]
+
+    owned = bool(user_id) and Conversation.query.filter_by(id=conversation_id, user_id=user_id).first() is not None
+    allowed = conversation_id if owned else None
+    socket_conversations[request.sid] = (user_id, conversation_id, allowed)
+    return allowed
+
+def build_user_data(user, emotion_detected):
+    """Profile + emotion payload passed to the chatbot for one turn (profile part comes from the cache)."""
+    return {
+        **profile_cache.get(user).prompt_inputs,
+        'voice_emotion': emotion_detected, 
+        'facial_emotion': emotion_detected
+    }
+
 def login_required(f):
     """Decorator to ensure user is logged in."""
     def decorated_function(*args, **kwargs):
@@ -77,6 +131,22 @@ def login_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+def rate_limited(event):
+    """Decorator applying per-user/global rate limits and load shedding to an endpoint (after login_required)."""
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            user_id = session.get('user_id')
+            with admission_control.admit(event, user_id) as decision:
+                if decision == ADMITTED:
+                    return f(*args, **kwargs)
+            if decision == SHED:
+                return jsonify({'success': False, 'message': 'The VTA is overloaded right now. Please try again shortly.'}), 503, {'Retry-After': '5'}
+            retry_after = max(1, math.ceil(admission_control.retry_after(event, user_id)))
+            return jsonify({'success': False, 'message': 'Too many requests. Please slow down.'}), 429, {'Retry-After': str(retry_after)}
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
 # --- Request Hooks ---
 
 @app.before_request
@@ -174,7 +244,8 @@ def signup():
     # Use the User model constructor which hashes the password
     new_user = User(name=name, username=username, email=email, password=password)
     db.session.add(new_user)
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
 
     # Log in the user by setting the session ID after successful signup
     session['user_id'] = new_user.id
@@ -190,16 +261,24 @@ def update_profile():
     dislikes = data.get('dislikes')
     context = data.get('context')
 
+    # likes/dislikes: a list of strings or one comma-separated string
+    for field, value in (('likes', likes), ('dislikes', dislikes)):
+        if value is not None and not (isinstance(value, str) or
+                                      (isinstance(value, list) and all(isinstance(v, str) for v in value))):
+            return jsonify({'success': False, 'message': f"{field} must be a list of strings or a comma-separated string"}), 400
+
     user = g.user # Use user loaded in before_request hook
     
     if likes is not None:
-        user.likes = ','.join(likes) if isinstance(likes, list) else likes
+        user.set_preferences('like', likes)
     if dislikes is not None:
-        user.dislikes = ','.join(dislikes) if isinstance(dislikes, list) else dislikes
+        user.set_preferences('dislike', dislikes)
     if context is not None:
         user.context = context
 
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
+    profile_cache.invalidate(user.id)
 
     return jsonify({'success': True, 'message': 'Profile updated successfully'}), 200
 
@@ -234,7 +313,9 @@ def logout():
 
 # API to handle chat messages
 @app.route('/api/chat', methods=['POST'])
+@timed_event('chat_message')
 @login_required
+@rate_limited('chat_message')
 def chat_message():
     data = request.get_json()
     message_content = data.get('message')
@@ -257,36 +338,34 @@ def chat_message():
         emotion_detected=emotion_detected
     )
     db.session.add(user_message)
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
 
     # 2. Call LLM API (Integrated Groq/LangChain)
-    context_text = g.user.context if g.user.context else "a student"
-    likes_text = g.user.likes if g.user.likes else ""
     llm_response_content = None # Initialize as None
-
-    user_data = {
-        'username': g.user.username,
-        'context': context_text,
-        'likes': likes_text,
-        'voice_emotion': emotion_detected, 
-        'facial_emotion': emotion_detected
-    }
+    user_data = build_user_data(g.user, emotion_detected)
 
     try:
-        # **CALLING GROQ CHATBOT**
-        llm_response_content = llm_chatbot.get_response(
-            conversation_id, 
-            message_content, 
-            user_data
-        )
+        # Reuse the reply speculatively generated from the voice transcription, if it matches this turn
+        llm_response_content = speculative_prefetcher.claim(conversation.id, message_content, user_data)
+
+        if llm_response_content is None:
+            # **CALLING GROQ CHATBOT**
+            llm_response_content = llm_chatbot.get_response(
+                conversation_id, 
+                message_content, 
+                user_data
+            )
     except Exception as e:
         # This catches global execution errors. Groq API errors are handled internally by the chatbot class.
         print(f"Global Chatbot Execution Failed: {e}. Falling back to generic response.")
+        count_fallback('chatbot_exception')
         llm_response_content = None 
 
     # **START OF LLM FALLBACK LOGIC**
     # The VTA should attempt a final response even if the LLM fails.
     if not llm_response_content or llm_response_content.isspace() or 'I apologize, ' in llm_response_content:
+        count_fallback('llm_generic_response')
         # This is the verbose fallback when the Groq API fails.
         llm_response_content = (
             f"It seems like we're experiencing a technical issue. Don't worry, let's try to resolve this together. The error message is indicating a problem with the LLM API configuration or connectivity. I'm here to help you navigate through any challenges that come up. How would you like to proceed?"
@@ -300,7 +379,8 @@ def chat_message():
         content=llm_response_content
     )
     db.session.add(vta_message)
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
 
     # NOTE: REMOVED time.sleep(0.5) to enable immediate frontend streaming
 
@@ -315,10 +395,7 @@ def chat_message():
 @login_required
 def get_profile():
     user = g.user
-    
-    # We must convert the comma-separated strings back to lists for the frontend
-    likes_list = user.likes.split(',') if user.likes else []
-    dislikes_list = user.dislikes.split(',') if user.dislikes else []
+    profile = profile_cache.get(user)
 
     return jsonify({
         'success': True,
@@ -326,8 +403,8 @@ def get_profile():
         'name': user.name,
         'username': user.username,
         'email': user.email,
-        'likes': likes_list,
-        'dislikes': dislikes_list,
+        'likes': profile.likes,
+        'dislikes': profile.dislikes,
         'context': user.context,
     }), 200
 
@@ -357,7 +434,8 @@ def new_session():
         title=title
     )
     db.session.add(new_conversation)
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
     
     # Add a welcoming VTA message to start the thread
     welcome_message = Message(
@@ -366,7 +444,8 @@ def new_session():
         content="Welcome! I'm your Emotion-Aware VTA. Let's start a new learning session. How are you feeling today?"
     )
     db.session.add(welcome_message)
-    db.session.commit()
+    with timed('db_commit'):
+        db.session.commit()
 
     return jsonify({
         'success': True, 
@@ -396,51 +475,268 @@ def get_session_messages(session_id):
 
     return jsonify({'success': True, 'messages': message_list, 'title': conversation.title}), 200
 
+# API to get the facial/voice emotion timeline of a session
+@app.route('/api/sessions/<int:session_id>/emotions', methods=['GET'])
+@login_required
+def get_session_emotions(session_id):
+    conversation = Conversation.query.filter_by(id=session_id, user_id=g.user.id).first()
 
-# --- SOCKETIO (Real-Time Emotion Detection) ---
+    if not conversation:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
 
-# For Video-based emotion-detection module (Facial Recognition)
-@socketio.on('video_stream')
-def handle_video_stream(data):
-    base64_frame = data.get('frame')
-    
-    if base64_frame:
-        # Call the external analysis function
-        detected_emotion = analyze_video_frame(base64_frame)
-    else:
-        detected_emotion = 'Neutral'
-        
-    # Emit the real-time emotion back to the client
-    emit('video_response', {'emotion': detected_emotion})
+    source = request.args.get('source')
+    if source is not None and source not in SOURCES:
+        return jsonify({'success': False, 'message': f"source must be one of {', '.join(SOURCES)}"}), 400
+    resolution = request.args.get('resolution', 60, type=int)
+    if not resolution or resolution <= 0:
+        return jsonify({'success': False, 'message': 'resolution must be a positive number of seconds'}), 400
 
+    # Make sure still-buffered samples of this session are included
+    emotion_telemetry.flush_conversation(g.user.id, session_id)
+    result = session_timeline(g.user.id, session_id, source=source, resolution=resolution)
 
-# For Voice-based emotion-detection module (Acoustic/Speech Recognition)
-@socketio.on('audio_stream')
-def handle_audio_stream(data):
-    # Data sent from the frontend is the binary audio Blob
-    audio_blob = data.get('audio') 
-    
-    results = {}
-    
-    # 1. Use the SER analyzer (Adapted from user's analyze_audio_blob logic)
+    return jsonify({'success': True, 'conversation_id': session_id, 'title': conversation.title, **result}), 200
+
+# API to get the emotion timeline and aggregates across all of the user's sessions
+@app.route('/api/emotions/summary', methods=['GET'])
+@login_required
+def get_emotion_summary():
+    source = request.args.get('source')
+    if source is not None and source not in SOURCES:
+        return jsonify({'success': False, 'message': f"source must be one of {', '.join(SOURCES)}"}), 400
+    resolution = request.args.get('resolution', 3600, type=int)
+    if not resolution or resolution <= 0:
+        return jsonify({'success': False, 'message': 'resolution must be a positive number of seconds'}), 400
+
+    emotion_telemetry.flush_user(g.user.id)
+    result = user_summary(g.user.id, source=source, resolution=resolution)
+
+    return jsonify({'success': True, 'user_id': g.user.id, **result}), 200
+
+
+# --- OBSERVABILITY ---
+
+# Prometheus scrape endpoint: stage histograms, event timings, error/fallback counters
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Most recent sampled profiles (enable with PROFILE_SAMPLE_RATE, e.g. 0.01)
+@app.route('/metrics/profiles')
+def metrics_profiles():
+    return jsonify({'success': True, 'profiles': list(RECENT_PROFILES)}), 200
+
+
+# --- BACKGROUND JOBS ---
+
+def run_audio_analysis(audio_blob):
+    """Runs the speech analyzer, mapping any failure to a displayable result."""
     try:
         # **CALLING EXTERNAL SPEECH ANALYZER MODULE**
-        results = analyze_audio_blob(audio_blob) 
+        return analyze_audio_blob(audio_blob) 
 
     except FileNotFoundError:
         # FFmpeg not found on PATH
-        results = {
+        return {
             'transcription': "Error: FFmpeg not found on PATH. Audio decoding failed.", 
             'emotion': 'Alert'
         }
     except Exception as e:
         # Catch any other decoding/processing failure
         print(f"Audio analysis failed: {e}")
-        results = {
+        count_fallback('audio_handler_exception')
+        return {
             'transcription': 'Audio input error. Please check your microphone.', 
             'emotion': 'Neutral'
         }
 
+def record_audio_results(user_id, conversation_id, results):
+    """Stores the voice emotion reading and, if enabled, starts the speculative LLM reply."""
+    emotion_telemetry.record(user_id, conversation_id, 'voice', results['emotion'])
+
+    # Speculatively start the LLM reply for the transcription the client is about to send
+    if speculative_prefetcher.enabled and user_id and conversation_id and is_candidate(results['transcription']):
+        user = User.query.get(user_id)
+        if user and Conversation.query.filter_by(id=conversation_id, user_id=user.id).first():
+            speculative_prefetcher.speculate(conversation_id, results['transcription'], build_user_data(user, results['emotion']))
+
+def audio_analysis_job(payload):
+    results = run_audio_analysis(payload['audio'])
+    record_audio_results(payload['user_id'], payload['conversation_id'], results)
+    return {'transcription': results['transcription'], 'emotion': results['emotion']}
+
+def session_summary_job(payload):
+    messages = Message.query.filter_by(conversation_id=payload['conversation_id']).order_by(Message.timestamp.asc()).all()
+    transcript = '\n'.join(
+        f"{'Student' if m.sender == 'user' else 'VTA'}"
+        f"{f' [{m.emotion_detected}]' if m.emotion_detected else ''}: {m.content}"
+        for m in messages
+    )
+    summary = llm_chatbot.summarize_session(transcript)  # raises -> retried by the queue
+    return {'conversation_id': payload['conversation_id'], 'summary': summary}
+
+def export_job(payload):
+    counts = export_ndjson(payload['path'], filters=user_filters(payload['user_id']))
+    return {'rows': counts, 'filename': os.path.basename(payload['path'])}
+
+job_queue.register('audio_analysis', audio_analysis_job)
+job_queue.register('session_summary', session_summary_job)
+job_queue.register('export', export_job)
+
+def deliver_job_result(job):
+    """Pushes a finished job to the Socket.IO client that submitted it (if any)."""
+    if not job.sid:
+        return
+    if job.result_event == 'audio_response' and job.status != 'done':
+        # The voice UI only listens for 'audio_response'; 'Error' keeps it from auto-sending the text
+        socketio.emit('audio_response', {
+            'transcription': 'Error: audio analysis failed. Please record again.',
+            'emotion': 'Alert'
+        }, to=job.sid)
+    elif job.result_event != 'job_result' and job.status == 'done':
+        socketio.emit(job.result_event, job.result, to=job.sid)
+    else:
+        socketio.emit('job_result', job.to_dict(), to=job.sid)
+
+def cleanup_exports(purged_jobs):
+    """Deletes the files of purged export jobs, then any export older than the job retention."""
+    for job in purged_jobs:
+        if job.kind == 'export' and job.result and job.result.get('filename'):
+            path = os.path.join(EXPORT_DIR, os.path.basename(job.result['filename']))
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Could not delete export of purged job {job.id}: {e}")
+    # Also catches files orphaned by a crash or by jobs purged before this sweep existed
+    cutoff = time.time() - job_queue.retention
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError as e:
+            print(f"Could not delete expired export {entry.name}: {e}")
+
+def ensure_job_queue():
+    job_queue.start(app, on_finish=deliver_job_result, on_purge=cleanup_exports)
+    return job_queue
+
+# API to summarize a study session in the background
+@app.route('/api/sessions/<int:session_id>/summary', methods=['POST'])
+@login_required
+def summarize_session(session_id):
+    conversation = Conversation.query.filter_by(id=session_id, user_id=g.user.id).first()
+
+    if not conversation:
+        return jsonify({'success': False, 'message': 'Conversation not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    job = ensure_job_queue().enqueue(
+        'session_summary', {'conversation_id': session_id},
+        priority=PRIORITY_NORMAL, user_id=g.user.id, sid=data.get('sid')  # socket.id, to get a 'job_result' event
+    )
+    return jsonify({'success': True, 'job_id': job.id}), 202
+
+# API to export the user's conversations as NDJSON in the background
+@app.route('/api/export', methods=['POST'])
+@login_required
+def export_conversations():
+    data = request.get_json(silent=True) or {}
+    path = os.path.join(EXPORT_DIR, f"user_{g.user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson")
+    job = ensure_job_queue().enqueue(
+        'export', {'user_id': g.user.id, 'path': path},
+        priority=PRIORITY_LOW, pool='bulk', user_id=g.user.id, sid=data.get('sid')
+    )
+    return jsonify({'success': True, 'job_id': job.id}), 202
+
+# API to poll a background job
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    job = ensure_job_queue().get(job_id)
+
+    if not job or job.user_id != g.user.id:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+
+    return jsonify({'success': True, **job.to_dict()}), 200
+
+# API to download the file produced by a finished export job
+@app.route('/api/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_job_file(job_id):
+    job = ensure_job_queue().get(job_id)
+
+    if not job or job.user_id != g.user.id or job.kind != 'export':
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'success': False, 'message': f"Export is {job.status}"}), 409
+
+    return send_from_directory(EXPORT_DIR, job.result['filename'], as_attachment=True)
+
+
+# --- SOCKETIO (Real-Time Emotion Detection) ---
+
+# For Video-based emotion-detection module (Facial Recognition)
+@socketio.on('video_stream')
+@timed_event('video_stream')
+def handle_video_stream(data):
+    with admission_control.admit('video_stream', request.sid) as decision:
+        if decision != ADMITTED:
+            # Degrade gracefully: repeat the last reading instead of running inference
+            emit('video_response', {'emotion': last_video_emotion.get(request.sid, 'Neutral'), 'throttled': decision})
+            return
+
+        base64_frame = data.get('frame')
+        
+        if base64_frame:
+            # Call the external analysis function
+            detected_emotion = analyze_video_frame(base64_frame)
+        else:
+            detected_emotion = 'Neutral'
+        last_video_emotion[request.sid] = detected_emotion
+
+        # Keep the reading for the session's emotion timeline
+        emotion_telemetry.record(session.get('user_id'), get_socket_conversation_id(data), 'face', detected_emotion)
+
+        # Emit the real-time emotion back to the client
+        emit('video_response', {'emotion': detected_emotion})
+
+
+# For Voice-based emotion-detection module (Acoustic/Speech Recognition)
+@socketio.on('audio_stream')
+@timed_event('audio_stream')
+def handle_audio_stream(data):
+    with admission_control.admit('audio_stream', request.sid) as decision:
+        if decision != ADMITTED:
+            # 'Error' keeps the frontend from auto-sending this text as a chat message
+            emit('audio_response', {
+                'transcription': 'Error: the server is busy. Please record again in a moment.',
+                'emotion': 'Alert',
+                'throttled': decision
+            })
+            return
+        analyze_audio_stream(data)
+
+def analyze_audio_stream(data):
+    # Data sent from the frontend is the binary audio Blob
+    audio_blob = data.get('audio') 
+    user_id = session.get('user_id')
+    conversation_id = get_socket_conversation_id(data)
+
+    # Long recordings are analyzed in the background; 'audio_response' is emitted when the job finishes
+    if audio_blob and len(audio_blob) > LARGE_AUDIO_BYTES:
+        job = ensure_job_queue().enqueue(
+            'audio_analysis',
+            {'audio': audio_blob, 'user_id': user_id, 'conversation_id': conversation_id},
+            priority=PRIORITY_HIGH, user_id=user_id, sid=request.sid, result_event='audio_response'
+        )
+        emit('job_queued', {'job_id': job.id, 'kind': job.kind})
+        return
+
+    # 1. Use the SER analyzer (Adapted from user's analyze_audio_blob logic)
+    results = run_audio_analysis(audio_blob)
+    record_audio_results(user_id, conversation_id, results)
+
     # 2. Emit the results back to the client (to populate the input box)
     emit('audio_response', {
         'transcription': results['transcription'],
@@ -448,8 +744,22 @@ def handle_audio_stream(data):
     })
 
 
+# Persist whatever telemetry the client still has buffered when it goes away
+@socketio.on('disconnect')
+def handle_disconnect():
+    admission_control.forget(request.sid)
+    last_video_emotion.pop(request.sid, None)
+    socket_conversations.pop(request.sid, None)
+    user_id = session.get('user_id')
+    if user_id:
+        emotion_telemetry.flush_user(user_id)
+
+
 # Main 
 if __name__ == '__main__':
     create_db()
+    # Only start workers in the serving process, not in the debug reloader's watcher process
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ensure_job_queue()
     # Use socketio.run for Flask-SocketIO apps
     socketio.run(app, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
@@ -0,0 +1 @@
+# Offline load-testing and benchmark suite for the real-time paths (see load_test.py)
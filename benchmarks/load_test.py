@@ -0,0 +1,376 @@
+"""
+End-to-end load test for the real-time paths of the EVTA Flask app.
+
+Simulates N students, each with its own Flask test client (logged-in session) and Socket.IO
+test client, firing a shuffled mix of `video_stream` frames, `audio_stream` blobs and
+`/api/chat` messages. Models and the LLM are replaced by stubs (see stubs.py) so the run is
+offline and CPU-only, while the real analyzer code, handlers and DB writes are exercised.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --students 200 --concurrency 32
+    python -m benchmarks.load_test --output bench.json
+    python -m benchmarks.load_test --baseline bench.json --tolerance 0.2   # exits 1 on regression
+    python -m benchmarks.load_test --audio-cache-hits   # measure the audio result cache hit path
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stubs import install_stubs, STUB_LATENCY
+
+EVENT_TYPES = ('video_stream', 'audio_stream', 'chat_message')
+PERCENTILES = (50, 95, 99)
+
+
+# --- INPUT FIXTURES ---
+
+def make_video_frame(path=None):
+    """Returns a JPEG data URL, as produced by canvas.toDataURL('image/jpeg') in index.html."""
+    import cv2
+
+    if path:
+        frame = cv2.imread(path)
+        if frame is None:
+            raise ValueError(f"Could not read frame image: {path}")
+    else:
+        # Deterministic 640x480 gradient. It contains no face; the stub detector (see stubs.py)
+        # reports one anyway, so the ROI resize, normalization and predict() still run.
+        xs = np.linspace(0, 255, 640, dtype=np.uint8)
+        frame = np.dstack([np.tile(xs, (480, 1))] * 3)
+    ok, encoded = cv2.imencode('.jpg', frame)
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return 'data:image/jpeg;base64,' + base64.b64encode(encoded.tobytes()).decode('ascii')
+
+
+def load_audio_source(path=None, seconds=3.0):
+    """The recording audio fixtures are built from: --audio-file, or a synthetic tone. Requires FFmpeg."""
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+
+    if path:
+        return AudioSegment.from_file(path)
+    return Sine(220).to_audio_segment(duration=int(seconds * 1000)).set_frame_rate(48000)
+
+
+def make_audio_blob(source, variant=0):
+    """
+    Returns WebM/Opus bytes, as produced by MediaRecorder in index.html.
+    A non-zero `variant` mixes in a faint tone of a variant-specific pitch, so every variant
+    has different bytes and misses the content-addressed AUDIO_CACHE.
+    """
+    from pydub.generators import Sine
+
+    if variant:
+        marker = Sine(1000 + variant).to_audio_segment(duration=len(source), volume=-50.0)
+        source = source.overlay(marker)
+    buffer = io.BytesIO()
+    source.export(buffer, format='webm', codec='libopus')
+    return buffer.getvalue()
+
+
+def build_audio_blobs(args):
+    """
+    Returns {student index: [blob per audio_stream event]} for the warm-up student (0) and all
+    measured students. By default every event gets a distinct blob so decode/STT/SER always run;
+    with --audio-cache-hits every event sends the same bytes and measures the cache hit path.
+    """
+    indices = range(args.students + 1)
+    clips_per_student = args.audio_clips
+    if not clips_per_student:
+        return {i: [] for i in indices}
+    try:
+        if args.audio_cache_hits:
+            if args.audio_file:
+                with open(args.audio_file, 'rb') as f:
+                    blob = f.read()
+            else:
+                blob = make_audio_blob(load_audio_source())
+            return {i: [blob] * clips_per_student for i in indices}
+
+        source = load_audio_source(args.audio_file)
+        keys = [(i, clip) for i in indices for clip in range(clips_per_student)]
+        # FFmpeg runs in subprocesses, so encoding in threads scales with the cores
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            blobs = list(pool.map(lambda variant: make_audio_blob(source, variant), range(1, len(keys) + 1)))
+    except Exception as e:
+        # Timing the empty-blob path instead would report fast, error-free audio_stream numbers
+        raise RuntimeError(f"Could not build the audio fixtures ({e}). FFmpeg is required; "
+                           f"pass --audio-clips 0 to benchmark without audio_stream.") from e
+
+    if len(set(blobs)) < len(blobs):
+        print("WARNING: some audio fixtures are byte-identical; those audio_stream events will hit the cache.")
+    audio_blobs = {i: [] for i in indices}
+    for (i, _), blob in zip(keys, blobs):
+        audio_blobs[i].append(blob)
+    return audio_blobs
+
+
+# --- MEASUREMENT ---
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if the platform does not expose it."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+class LatencyRecorder:
+    """Thread-safe collection of per-event latencies and error counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {event: [] for event in EVENT_TYPES}
+        self.errors = {event: 0 for event in EVENT_TYPES}
+
+    def record(self, event, seconds, ok=True):
+        with self._lock:
+            self.latencies[event].append(seconds)
+            if not ok:
+                self.errors[event] += 1
+
+    def summary(self, wall_seconds):
+        report = {}
+        for event in EVENT_TYPES:
+            samples = np.asarray(self.latencies[event], dtype=np.float64) * 1000.0
+            if samples.size == 0:
+                continue
+            stats = {
+                'count': int(samples.size),
+                'errors': self.errors[event],
+                'throughput_per_s': samples.size / wall_seconds if wall_seconds > 0 else 0.0,
+                'mean_ms': float(samples.mean()),
+                'max_ms': float(samples.max()),
+            }
+            for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+                stats[f'p{p}_ms'] = float(value)
+            report[event] = stats
+        return report
+
+
+# --- SIMULATED STUDENT ---
+
+def is_audio_error(response):
+    """True for the fallback texts analyze_audio_blob returns instead of raising (e.g. a stub/model input mismatch)."""
+    if response.get('throttled'):
+        return False
+    return response.get('transcription', '').startswith(('Error', 'Audio input error', 'Speech models failed'))
+
+
+def simulate_student(evta, index, args, frame, audio_blobs, recorder):
+    """Signs up one student, opens a session and replays a shuffled event mix (one blob per audio event)."""
+    client = evta.app.test_client()
+    username = f"bench_student_{index}"
+    client.post('/signup', json={
+        'name': f"Bench Student {index}",
+        'username': username,
+        'email': f"{username}@bench.local",
+        'password': 'bench-password',
+        'confirm_password': 'bench-password',
+    })
+    client.put('/api/profile', json={'likes': ['football', 'music'], 'context': 'a high-school student'})
+    conversation_id = client.post('/api/sessions/new').get_json()['conversation_id']
+    sio = evta.socketio.test_client(evta.app, flask_test_client=client)
+
+    events = (['video_stream'] * args.frames
+              + ['audio_stream'] * args.audio_clips
+              + ['chat_message'] * args.chats)
+    random.Random(args.seed + index).shuffle(events)
+    clips = iter(audio_blobs)
+
+    try:
+        for event in events:
+            start = time.perf_counter()
+            ok = True
+            try:
+                if event == 'video_stream':
+                    sio.emit('video_stream', {'frame': frame, 'conversation_id': conversation_id})
+                    ok = any(p['name'] == 'video_response' for p in sio.get_received())
+                elif event == 'audio_stream':
+                    sio.emit('audio_stream', {'audio': next(clips), 'conversation_id': conversation_id})
+                    ok = any(p['name'] == 'audio_response' and not is_audio_error(p['args'][0])
+                             for p in sio.get_received())
+                else:
+                    response = client.post('/api/chat', json={
+                        'message': f"Question {index}: why is the sky blue?",
+                        'conversation_id': conversation_id,
+                        'emotion_detected': 'Neutral',
+                    })
+                    ok = response.status_code == 200
+            except Exception as e:
+                print(f"[student {index}] {event} failed: {e}")
+                ok = False
+            recorder.record(event, time.perf_counter() - start, ok)
+    finally:
+        sio.disconnect()
+
+
+def run_load(evta, args, frame, audio_blobs):
+    recorder = LatencyRecorder()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(simulate_student, evta, i, args, frame, audio_blobs[i], recorder)
+            for i in range(1, args.students + 1)
+        ]
+        for future in futures:
+            future.result()
+    return recorder, time.perf_counter() - start
+
+
+# --- REPORTING ---
+
+def print_report(results):
+    print(f"\nStudents: {results['students']}  Concurrency: {results['concurrency']}  "
+          f"Audio: {results['audio_scenario']}  Wall time: {results['wall_seconds']:.2f}s")
+    header = f"{'event':<14}{'count':>7}{'errors':>8}{'ev/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for event, s in results['events'].items():
+        print(f"{event:<14}{s['count']:>7}{s['errors']:>8}{s['throughput_per_s']:>9.1f}"
+              f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+    memory = results['memory']
+    if memory.get('rss_growth_bytes') is not None:
+        print(f"\nRSS: {memory['rss_start_bytes'] / 2**20:.1f} MiB -> {memory['rss_end_bytes'] / 2**20:.1f} MiB "
+              f"(growth {memory['rss_growth_bytes'] / 2**20:+.1f} MiB)")
+    if memory.get('traced_growth_bytes') is not None:
+        print(f"Python heap growth (tracemalloc): {memory['traced_growth_bytes'] / 2**20:+.2f} MiB")
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Returns a list of human-readable regressions (p95 latency up or throughput down by > tolerance)."""
+    regressions = []
+    for event, current in results['events'].items():
+        previous = baseline.get('events', {}).get(event)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{event}: p95 {previous['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if current['throughput_per_s'] < previous['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{event}: throughput {previous['throughput_per_s']:.1f}/s -> {current['throughput_per_s']:.1f}/s")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{event}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for EVTA real-time paths.")
+    parser.add_argument('--students', type=int, default=200, help="Number of simulated students")
+    parser.add_argument('--concurrency', type=int, default=32, help="Students running at the same time")
+    parser.add_argument('--frames', type=int, default=10, help="video_stream events per student")
+    parser.add_argument('--audio-clips', type=int, default=2, help="audio_stream events per student")
+    parser.add_argument('--chats', type=int, default=2, help="/api/chat messages per student")
+    parser.add_argument('--seed', type=int, default=1234, help="Seed for the per-student event order")
+    parser.add_argument('--frame-file', help="Image to send as the video frame (default: synthetic)")
+    parser.add_argument('--audio-file', help="Recording the audio blobs are built from (default: synthetic tone)")
+    parser.add_argument('--audio-cache-hits', action='store_true',
+                        help="Send one identical audio blob everywhere to measure the AUDIO_CACHE hit path "
+                             "(default: a distinct blob per event, so every event runs decode/STT/SER)")
+    parser.add_argument('--video-latency', type=float, default=STUB_LATENCY['video_predict'])
+    parser.add_argument('--ser-latency', type=float, default=STUB_LATENCY['ser'])
+    parser.add_argument('--stt-latency', type=float, default=STUB_LATENCY['stt'])
+    parser.add_argument('--llm-latency', type=float, default=STUB_LATENCY['llm'])
+    parser.add_argument('--rate-limiting', action='store_true',
+                        help="Keep admission control on (default off, so every event runs the full analysis)")
+    parser.add_argument('--tracemalloc', action='store_true', help="Also measure Python heap growth (slower)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results from a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression vs baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    install_stubs({
+        'video_predict': args.video_latency,
+        'ser': args.ser_latency,
+        'stt': args.stt_latency,
+        'llm': args.llm_latency,
+    })
+
+    # Scratch database so the benchmark never touches instance/site.db
+    scratch_dir = tempfile.mkdtemp(prefix='evta-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch_dir, 'bench.db')}"
+    os.environ['RATE_LIMITING'] = '1' if args.rate_limiting else '0'
+
+    import app as evta
+    evta.create_db()
+
+    frame = make_video_frame(args.frame_file)
+    audio_blobs = build_audio_blobs(args)
+
+    # Warm-up student (not measured): first-call imports, cascade setup, DB file creation.
+    # It has its own blobs, so in the default scenario it does not warm the cache for the measured run.
+    warmup_args = argparse.Namespace(**{**vars(args), 'frames': 1, 'audio_clips': min(args.audio_clips, 1), 'chats': 1})
+    simulate_student(evta, 0, warmup_args, frame, audio_blobs[0], LatencyRecorder())
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    traced_start = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+    rss_start = current_rss_bytes()
+
+    recorder, wall_seconds = run_load(evta, args, frame, audio_blobs)
+
+    rss_end = current_rss_bytes()
+    traced_end = tracemalloc.get_traced_memory()[0] if args.tracemalloc else None
+
+    results = {
+        'students': args.students,
+        'concurrency': args.concurrency,
+        'wall_seconds': wall_seconds,
+        'audio_scenario': 'cache_hit' if args.audio_cache_hits else 'cache_miss',
+        'stub_latency_s': dict(STUB_LATENCY),
+        'events': recorder.summary(wall_seconds),
+        'memory': {
+            'rss_start_bytes': rss_start,
+            'rss_end_bytes': rss_end,
+            'rss_growth_bytes': rss_end - rss_start if rss_start is not None and rss_end is not None else None,
+            'traced_growth_bytes': traced_end - traced_start if args.tracemalloc else None,
+        },
+    }
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('audio_scenario') != results['audio_scenario']:
+            print(f"\nWARNING: baseline audio scenario is {baseline.get('audio_scenario', 'unknown')}, "
+                  f"this run is {results['audio_scenario']}; audio_stream numbers are not comparable.")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nNo regressions vs baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+Streaming export and bulk import of User / Conversation / Message rows.
+
+Export reads each table with a server-side cursor in fixed-size chunks (constant memory)
+and writes newline-delimited JSON or one Parquet file per table (requires pyarrow).
+Import and seed use batched executemany INSERTs.
+
+Usage (from the repository root; DATABASE_URL defaults to the app's SQLite database):
+    python dataPipeline.py export --format ndjson --output export.ndjson
+    python dataPipeline.py export --format parquet --output export_dir/
+    python dataPipeline.py import --format ndjson --input export.ndjson --analytics-only  # export without --include-secrets
+    python dataPipeline.py seed --users 1000 --conversations 5 --messages 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import select, insert, func, event
+from sqlalchemy.types import DateTime, Integer
+from werkzeug.security import generate_password_hash
+from database import db, User, Conversation, Message, backfill_preferences
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# --- CONFIGURATION ---
+CHUNK_SIZE = 5000     # rows fetched per server-side cursor round trip
+BATCH_SIZE = 10000    # rows per executemany INSERT
+COMMIT_EVERY = 10     # batches per transaction
+
+# Parent tables first so foreign keys resolve on import
+MODELS = [User, Conversation, Message]
+TABLES = {model.__tablename__: model for model in MODELS}
+
+# Excluded from exports unless --include-secrets (needed only for full migrations)
+SECRET_COLUMNS = {'user': {'password_hash', 'social_id'}}
+
+
+def create_pipeline_app():
+    """Minimal app bound to the same database as app.py, without loading any ML models."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _columns(model, include_secrets=False):
+    hidden = set() if include_secrets else SECRET_COLUMNS.get(model.__tablename__, set())
+    return [c for c in model.__table__.columns if c.name not in hidden]
+
+
+# --- EXPORT ---
+
+def user_filters(user_id):
+    """Per-table WHERE clauses restricting an export to one user's data."""
+    conversation_ids = select(Conversation.id).where(Conversation.user_id == user_id)
+    return {
+        'user': User.id == user_id,
+        'conversation': Conversation.user_id == user_id,
+        'message': Message.conversation_id.in_(conversation_ids),
+    }
+
+
+def iter_chunks(model, chunk_size=CHUNK_SIZE, include_secrets=False, where=None):
+    """Yields lists of row dicts, streamed from a server-side cursor `chunk_size` rows at a time."""
+    columns = _columns(model, include_secrets)
+    stmt = select(*columns)
+    if where is not None:
+        stmt = stmt.where(where)
+    stmt = stmt.order_by(model.__table__.c.id).execution_options(yield_per=chunk_size)
+    result = db.session.execute(stmt)
+    for partition in result.partitions():
+        yield [dict(row._mapping) for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def export_ndjson(output, chunk_size=CHUNK_SIZE, include_secrets=False, filters=None):
+    """
+    Writes one JSON object per line, tagged with its table in `_table`. Returns row counts.
+    `filters` optionally maps table name -> WHERE clause (see user_filters).
+    """
+    filters = filters or {}
+    counts = {}
+    with open(output, 'w', encoding='utf-8') as f:
+        for model in MODELS:
+            table = model.__tablename__
+            counts[table] = 0
+            for chunk in iter_chunks(model, chunk_size, include_secrets, filters.get(table)):
+                f.write(''.join(
+                    json.dumps({'_table': table, **row}, default=_json_default, ensure_ascii=False) + '\n'
+                    for row in chunk
+                ))
+                counts[table] += len(chunk)
+    return counts
+
+
+def _arrow_schema(columns):
+    def arrow_type(column):
+        if isinstance(column.type, DateTime):
+            return pa.timestamp('us')
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        return pa.string()
+    return pa.schema([pa.field(c.name, arrow_type(c), nullable=c.nullable or c.primary_key) for c in columns])
+
+
+def export_parquet(output_dir, chunk_size=CHUNK_SIZE, include_secrets=False):
+    """Writes <output_dir>/<table>.parquet, one row group per chunk. Returns row counts."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    for model in MODELS:
+        table = model.__tablename__
+        schema = _arrow_schema(_columns(model, include_secrets))
+        counts[table] = 0
+        with pq.ParquetWriter(os.path.join(output_dir, f"{table}.parquet"), schema) as writer:
+            for chunk in iter_chunks(model, chunk_size, include_secrets):
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                counts[table] += len(chunk)
+    return counts
+
+
+# --- IMPORT ---
+
+def _enable_fast_sqlite_writes():
+    """For SQLite, trade durability for speed during bulk loads (WAL, no fsync per commit)."""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.close()
+
+    engine.dispose()  # re-open pooled connections so the pragmas apply
+
+
+class BulkInserter:
+    """
+    Buffers row dicts per table and flushes them as batched executemany INSERTs.
+    Rows missing a SECRET_COLUMNS key (an export made without --include-secrets) are refused
+    unless `allow_missing_secrets`, since e.g. users without password_hash cannot log in.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY, allow_missing_secrets=False):
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.allow_missing_secrets = allow_missing_secrets
+        self.pending = {table: [] for table in TABLES}
+        self.counts = {table: 0 for table in TABLES}
+        self._batches_since_commit = 0
+        self._datetime_columns = {
+            table: [c.name for c in model.__table__.columns if isinstance(c.type, DateTime)]
+            for table, model in TABLES.items()
+        }
+
+    def add(self, table, row):
+        if table not in TABLES:
+            raise ValueError(f"Unknown table '{table}'")
+        if not self.allow_missing_secrets:
+            missing = SECRET_COLUMNS.get(table, set()) - row.keys()
+            if missing:
+                raise ValueError(f"'{table}' rows lack {', '.join(sorted(missing))}: the export was made without "
+                                 f"--include-secrets. Pass --analytics-only to import it anyway "
+                                 f"(those users will not be able to log in).")
+        for name in self._datetime_columns[table]:
+            value = row.get(name)
+            if isinstance(value, str):
+                row[name] = datetime.fromisoformat(value)
+        self.pending[table].append(row)
+        if len(self.pending[table]) >= self.batch_size:
+            self.flush_through(table)
+
+    def flush_through(self, table):
+        """Flushes `table` and every parent table before it, so foreign keys always resolve."""
+        for name in TABLES:
+            self._flush_table(name)
+            if name == table:
+                break
+
+    def _flush_table(self, table):
+        rows = self.pending[table]
+        if not rows:
+            return
+        # executemany needs one key set for the whole batch
+        keys = set().union(*rows)
+        batch = [{key: row.get(key) for key in keys} for row in rows]
+        db.session.execute(insert(TABLES[table].__table__), batch)
+        self.counts[table] += len(batch)
+        self.pending[table] = []
+        self._batches_since_commit += 1
+        if self._batches_since_commit >= self.commit_every:
+            db.session.commit()
+            self._batches_since_commit = 0
+
+    def close(self):
+        self.flush_through(MODELS[-1].__tablename__)
+        db.session.commit()
+        return self.counts
+
+
+def import_ndjson(path, batch_size=BATCH_SIZE, allow_missing_secrets=False):
+    inserter = BulkInserter(batch_size, allow_missing_secrets=allow_missing_secrets)
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            inserter.add(row.pop('_table'), row)
+    return inserter.close()
+
+
+def import_parquet(input_dir, batch_size=BATCH_SIZE, allow_missing_secrets=False):
+    if pq is None:
+        raise RuntimeError("Parquet import requires pyarrow (pip install pyarrow).")
+    inserter = BulkInserter(batch_size, allow_missing_secrets=allow_missing_secrets)
+    for table in TABLES:
+        path = os.path.join(input_dir, f"{table}.parquet")
+        if not os.path.exists(path):
+            continue
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for row in record_batch.to_pylist():
+                inserter.add(table, row)
+        inserter.flush_through(table)
+    return inserter.close()
+
+
+# --- SEED ---
+
+def seed(num_users, conversations_per_user, messages_per_conversation, batch_size=BATCH_SIZE):
+    """Generates synthetic users/conversations/messages with explicit ids and batched inserts."""
+    rng = random.Random(42)
+    emotions = ['Happy', 'Neutral', 'Sad', 'Angry', 'Surprise', None]
+    password_hash = generate_password_hash('seed-password')  # hashed once, shared by all seed users
+    next_id = {table: (db.session.scalar(select(func.max(model.__table__.c.id))) or 0) + 1
+               for table, model in TABLES.items()}
+    start = datetime.utcnow() - timedelta(days=30)
+
+    inserter = BulkInserter(batch_size)
+    for u in range(num_users):
+        user_id = next_id['user'] + u
+        inserter.add('user', {
+            'id': user_id, 'name': f"Seed User {user_id}", 'username': f"seed_user_{user_id}",
+            'email': f"seed_user_{user_id}@example.com", 'password_hash': password_hash, 'social_id': None,
+            'likes': 'science,music', 'dislikes': None, 'context': 'a student', 'theme': 'dark',
+        })
+    for u in range(num_users):
+        user_id = next_id['user'] + u
+        for c in range(conversations_per_user):
+            conversation_id = next_id['conversation'] + u * conversations_per_user + c
+            created = start + timedelta(minutes=rng.randrange(30 * 24 * 60))
+            inserter.add('conversation', {
+                'id': conversation_id, 'user_id': user_id,
+                'title': f"Seed Session {conversation_id}", 'created_at': created,
+            })
+            base = next_id['message'] + (u * conversations_per_user + c) * messages_per_conversation
+            for m in range(messages_per_conversation):
+                sender = 'user' if m % 2 else 'vta'
+                inserter.add('message', {
+                    'id': base + m, 'conversation_id': conversation_id, 'sender': sender,
+                    'content': f"Seed message {m} of session {conversation_id}",
+                    'emotion_detected': rng.choice(emotions) if sender == 'user' else None,
+                    'timestamp': created + timedelta(seconds=30 * m),
+                })
+    return inserter.close()
+
+
+def _report(action, counts, seconds):
+    total = sum(counts.values())
+    detail = ', '.join(f"{table}={n}" for table, n in counts.items())
+    rate = total / seconds if seconds > 0 else float('inf')
+    print(f"{action}: {total} rows ({detail}) in {seconds:.2f}s — {rate:,.0f} rows/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export/import EVTA conversation data.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export_p = sub.add_parser('export', help="Stream User/Conversation/Message rows to a file")
+    export_p.add_argument('--format', choices=['ndjson', 'parquet'], default='ndjson')
+    export_p.add_argument('--output', required=True, help="NDJSON file, or directory for Parquet")
+    export_p.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    export_p.add_argument('--include-secrets', action='store_true', help="Also export password hashes/social ids")
+
+    import_p = sub.add_parser('import', help="Bulk insert rows from an export")
+    import_p.add_argument('--format', choices=['ndjson', 'parquet'], default='ndjson')
+    import_p.add_argument('--input', required=True, help="NDJSON file, or directory of Parquet files")
+    import_p.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    import_p.add_argument('--analytics-only', action='store_true',
+                          help="Accept exports made without --include-secrets (imported users cannot log in)")
+    import_p.add_argument('--fast', action='store_true', help="SQLite only: WAL + synchronous=OFF while loading")
+
+    seed_p = sub.add_parser('seed', help="Insert synthetic test data")
+    seed_p.add_argument('--users', type=int, default=100)
+    seed_p.add_argument('--conversations', type=int, default=5, help="Conversations per user")
+    seed_p.add_argument('--messages', type=int, default=20, help="Messages per conversation")
+    seed_p.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    seed_p.add_argument('--fast', action='store_true', help="SQLite only: WAL + synchronous=OFF while loading")
+
+    args = parser.parse_args(argv)
+    app = create_pipeline_app()
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        if args.command == 'export':
+            writer = export_parquet if args.format == 'parquet' else export_ndjson
+            counts = writer(args.output, args.chunk_size, args.include_secrets)
+            _report('Exported', counts, time.perf_counter() - start)
+        else:
+            if args.fast:
+                _enable_fast_sqlite_writes()
+            if args.command == 'import':
+                reader = import_parquet if args.format == 'parquet' else import_ndjson
+                counts = reader(args.input, args.batch_size, args.analytics_only)
+                _report('Imported', counts, time.perf_counter() - start)
+            else:
+                counts = seed(args.users, args.conversations, args.messages, args.batch_size)
+                _report('Seeded', counts, time.perf_counter() - start)
+            # Rows only carry the legacy likes/dislikes text; create their UserPreference rows
+            start = time.perf_counter()
+            migrated = backfill_preferences(args.batch_size)
+            print(f"Backfilled {migrated} likes/dislikes lists in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
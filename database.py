@@ -17,6 +17,8 @@ class User(db.Model):
     social_id = db.Column(db.String(255), unique=True, nullable=True)
     
     # Add new columns for user preferences and context
+    # NOTE: likes/dislikes are a denormalized comma-separated copy kept for older readers;
+    # the normalized, indexed source of truth is UserPreference (use get/set_preferences).
     likes = db.Column(db.Text, nullable=True)
     dislikes = db.Column(db.Text, nullable=True)
     context = db.Column(db.String(50), nullable=True)
@@ -27,6 +29,9 @@ class User(db.Model):
     # Relationship to Conversations
     conversations = db.relationship('Conversation', backref='user', lazy='dynamic')
 
+    # Relationship to normalized likes/dislikes
+    preferences = db.relationship('UserPreference', backref='user', lazy='dynamic', cascade="all, delete-orphan")
+
 
     def __init__(self, name, username, email, password=None, social_id=None):
         self.name = name
@@ -42,8 +47,98 @@ class User(db.Model):
     def check_password(self, password):
         # NOTE: The existing app.py uses check_password_hash directly on user.password, which is a bug if not fixed in app.py. 
         # I'm fixing this by ensuring we check against the hash.
+        # Social-login users and analytics-only imports have no hash
+        if not self.password_hash:
+            return False
         return check_password_hash(self.password_hash, password)
 
+    def get_preferences(self, kind):
+        """
+        Ordered list of 'like' or 'dislike' values. Read-only: users not migrated yet
+        (see backfill_preferences) are read from the legacy text column.
+        """
+        values = [p.value for p in self.preferences.filter_by(kind=kind).order_by(UserPreference.position)]
+        if not values:
+            values = parse_preferences(self.likes if kind == 'like' else self.dislikes)
+        return values
+
+    def set_preferences(self, kind, values):
+        """Replaces the user's 'like' or 'dislike' rows (caller commits) and syncs the legacy text column."""
+        values = parse_preferences(values)
+        self.preferences.filter_by(kind=kind).delete(synchronize_session=False)
+        for position, value in enumerate(values):
+            db.session.add(UserPreference(user_id=self.id, kind=kind, value=value, position=position))
+        if kind == 'like':
+            self.likes = ','.join(values)
+        else:
+            self.dislikes = ','.join(values)
+        return values
+
+
+def parse_preferences(values):
+    """Normalizes a list or comma-separated string: trimmed, non-empty, de-duplicated, order kept."""
+    if isinstance(values, str):
+        values = values.split(',')
+    seen = []
+    for value in values or []:
+        value = str(value).strip()[:120]
+        if value and value.lower() not in (v.lower() for v in seen):
+            seen.append(value)
+    return seen
+
+# Define the UserPreference model: one row per like/dislike, indexed for per-user reads
+# and for "which students like X" queries.
+class UserPreference(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # 'like' or 'dislike'
+    value = db.Column(db.String(120), nullable=False)
+    position = db.Column(db.Integer, default=0, nullable=False)  # order entered by the user
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'value', name='uq_user_preference'),
+        db.Index('ix_user_preference_user', 'user_id', 'kind', 'position'),
+        db.Index('ix_user_preference_value', 'kind', 'value'),
+    )
+
+    def __repr__(self):
+        return f'<UserPreference {self.kind}: {self.value}>'
+
+
+def backfill_preferences(batch_size=5000):
+    """
+    One-off migration: creates UserPreference rows for users that only have the legacy
+    likes/dislikes text. Users are read in id-ordered chunks of `batch_size` and their rows are
+    written with one executemany INSERT per chunk. Must run inside an app context.
+    Returns the number of lists migrated.
+    """
+    migrated = 0
+    for kind, legacy in (('like', User.likes), ('dislike', User.dislikes)):
+        # Users that already have rows of this kind are skipped, so no DELETE is needed
+        has_rows = db.select(UserPreference.id).where(
+            UserPreference.user_id == User.id, UserPreference.kind == kind
+        ).exists()
+        last_id = 0
+        while True:
+            chunk = db.session.execute(
+                db.select(User.id, legacy)
+                .where(User.id > last_id, legacy.isnot(None), legacy != '', ~has_rows)
+                .order_by(User.id).limit(batch_size)
+            ).all()
+            if not chunk:
+                break
+            rows = [
+                {'user_id': user_id, 'kind': kind, 'value': value, 'position': position}
+                for user_id, text in chunk
+                for position, value in enumerate(parse_preferences(text))
+            ]
+            if rows:
+                db.session.execute(db.insert(UserPreference), rows)
+            db.session.commit()
+            migrated += len(chunk)
+            last_id = chunk[-1][0]
+    return migrated
+
 # Define the Conversation/Session model
 class Conversation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -68,4 +163,34 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
-        return f'<Message {self.sender}: {self.content[:30]}>'
\ No newline at end of file
+        return f'<Message {self.sender}: {self.content[:30]}>'
+
+# Define the EmotionBucket model: downsampled facial/voice emotion telemetry.
+# One row = per-label sample counts for one (user, conversation, source) over `bucket_seconds`.
+# Rows are append-only (bulk inserted by emotionTelemetry.py); a bucket may span several rows
+# if it was flushed more than once, so readers always SUM by bucket_start.
+class EmotionBucket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=True)
+    source = db.Column(db.String(10), nullable=False)  # 'face' or 'voice'
+    bucket_start = db.Column(db.Integer, nullable=False)  # Unix epoch seconds, aligned to bucket_seconds
+    bucket_seconds = db.Column(db.Integer, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+
+    # One count column per canonical emotion label (see emotionTelemetry.EMOTION_LABELS)
+    angry = db.Column(db.Integer, default=0, nullable=False)
+    disgust = db.Column(db.Integer, default=0, nullable=False)
+    fear = db.Column(db.Integer, default=0, nullable=False)
+    happy = db.Column(db.Integer, default=0, nullable=False)
+    neutral = db.Column(db.Integer, default=0, nullable=False)
+    sad = db.Column(db.Integer, default=0, nullable=False)
+    surprise = db.Column(db.Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_emotion_bucket_conversation', 'conversation_id', 'source', 'bucket_start'),
+        db.Index('ix_emotion_bucket_user', 'user_id', 'bucket_start'),
+    )
+
+    def __repr__(self):
+        return f'<EmotionBucket {self.source} {self.bucket_start}: {self.sample_count}>'
@@ -0,0 +1,223 @@
+import os
+import time
+import threading
+import numpy as np
+from sqlalchemy import insert, func
+from database import db, EmotionBucket
+from metrics import timed, count_error
+
+# --- CONFIGURATION ---
+BUCKET_SECONDS = int(os.environ.get('EMOTION_BUCKET_SECONDS', '10'))  # storage resolution
+FLUSH_SAMPLES = 64      # flush a stream once this many samples are buffered...
+FLUSH_INTERVAL = 30.0   # ...or once its oldest buffered sample is this old (seconds)
+
+# Canonical labels = EmotionBucket count columns (FER labels; SER groups are a subset)
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
+LABEL_INDEX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+SOURCES = ('face', 'voice')
+
+# Valence groups used for the engagement aggregates
+POSITIVE = [LABEL_INDEX['happy'], LABEL_INDEX['surprise']]
+NEGATIVE = [LABEL_INDEX['angry'], LABEL_INDEX['disgust'], LABEL_INDEX['fear'], LABEL_INDEX['sad']]
+
+
+class EmotionStream:
+    """Columnar in-memory buffer (timestamps + label codes) for one (user, conversation, source)."""
+
+    __slots__ = ('timestamps', 'codes')
+
+    def __init__(self):
+        self.timestamps = []
+        self.codes = []
+
+
+class EmotionTelemetry:
+    """
+    Append-optimized emotion time-series store.
+    Socket.IO handlers call record() per detection (cheap list appends); buffered streams are
+    downsampled into BUCKET_SECONDS buckets with NumPy and bulk inserted as EmotionBucket rows.
+    """
+
+    def __init__(self, bucket_seconds=BUCKET_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self._streams = {}  # (user_id, conversation_id, source) -> EmotionStream
+        self._lock = threading.Lock()
+
+    def record(self, user_id, conversation_id, source, emotion, timestamp=None):
+        """Buffers one detection. Non-emotion results ('Model Error', 'Alert', ...) are ignored."""
+        code = LABEL_INDEX.get(str(emotion).lower())
+        if code is None or not user_id or source not in SOURCES:
+            return
+        key = (user_id, conversation_id, source)
+        now = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = self._streams[key] = EmotionStream()
+            stream.timestamps.append(now)
+            stream.codes.append(code)
+            due = len(stream.codes) >= FLUSH_SAMPLES or now - stream.timestamps[0] >= FLUSH_INTERVAL
+
+        if due:
+            self.flush(lambda k: k == key)
+
+    def flush(self, match=None):
+        """
+        Downsamples and bulk inserts every buffered stream whose key satisfies `match`
+        (all streams if None). Must run inside an app context.
+        """
+        with self._lock:
+            keys = [k for k in self._streams if match is None or match(k)]
+            drained = [(k, self._streams.pop(k)) for k in keys]
+
+        rows = []
+        for (user_id, conversation_id, source), stream in drained:
+            rows.extend(self._downsample(user_id, conversation_id, source, stream))
+        if not rows:
+            return 0
+
+        try:
+            with timed('telemetry_flush'):
+                db.session.execute(insert(EmotionBucket), rows)
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            count_error('telemetry_flush')
+            print(f"Emotion telemetry flush failed ({len(rows)} buckets dropped): {e}")
+            return 0
+        return len(rows)
+
+    def flush_user(self, user_id):
+        return self.flush(lambda k: k[0] == user_id)
+
+    def flush_conversation(self, user_id, conversation_id):
+        return self.flush(lambda k: k[0] == user_id and k[1] == conversation_id)
+
+    def _downsample(self, user_id, conversation_id, source, stream):
+        timestamps = np.asarray(stream.timestamps, dtype=np.float64)
+        codes = np.asarray(stream.codes, dtype=np.int64)
+        starts = (timestamps // self.bucket_seconds).astype(np.int64) * self.bucket_seconds
+
+        bucket_starts, bucket_idx = np.unique(starts, return_inverse=True)
+        counts = np.zeros((len(bucket_starts), len(EMOTION_LABELS)), dtype=np.int64)
+        np.add.at(counts, (bucket_idx, codes), 1)
+
+        return [
+            {
+                'user_id': user_id,
+                'conversation_id': conversation_id,
+                'source': source,
+                'bucket_start': int(start),
+                'bucket_seconds': self.bucket_seconds,
+                'sample_count': int(row.sum()),
+                **{label: int(n) for label, n in zip(EMOTION_LABELS, row)},
+            }
+            for start, row in zip(bucket_starts, counts)
+        ]
+
+
+# --- ANALYTICS (vectorized over EmotionBucket rows) ---
+
+def _load_buckets(filters):
+    """Returns (bucket_start[int64], conversation_id[int64], counts[n, labels]) for matching rows."""
+    # NULL conversation ids become -1 in SQL, so the rows convert to one int64 matrix in a single call
+    columns = [EmotionBucket.bucket_start, func.coalesce(EmotionBucket.conversation_id, -1)] + \
+              [getattr(EmotionBucket, label) for label in EMOTION_LABELS]
+    rows = db.session.query(*columns).filter(*filters).all()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, len(EMOTION_LABELS)), np.int64)
+    data = np.array(rows, dtype=np.int64)
+    return data[:, 0], data[:, 1], data[:, 2:]
+
+
+def _aggregate(counts):
+    """Totals, distribution, dominant label and valence ratios for an (n, labels) count matrix."""
+    totals = counts.sum(axis=0)
+    samples = int(totals.sum())
+    if samples == 0:
+        return {'samples': 0, 'counts': {}, 'distribution': {}, 'dominant': None,
+                'positive_ratio': 0.0, 'negative_ratio': 0.0, 'neutral_ratio': 0.0}
+    distribution = totals / samples
+    return {
+        'samples': samples,
+        'counts': {label: int(n) for label, n in zip(EMOTION_LABELS, totals)},
+        'distribution': {label: round(float(p), 4) for label, p in zip(EMOTION_LABELS, distribution)},
+        'dominant': EMOTION_LABELS[int(totals.argmax())].capitalize(),
+        'positive_ratio': round(float(distribution[POSITIVE].sum()), 4),
+        'negative_ratio': round(float(distribution[NEGATIVE].sum()), 4),
+        'neutral_ratio': round(float(distribution[LABEL_INDEX['neutral']]), 4),
+    }
+
+
+def _bin_timeline(starts, counts, resolution):
+    """Re-buckets (bucket_start, counts) rows to `resolution` seconds: one point per non-empty bin."""
+    if not starts.size:
+        return []
+    aligned = starts // resolution * resolution
+    points, idx = np.unique(aligned, return_inverse=True)
+    binned = np.zeros((len(points), len(EMOTION_LABELS)), dtype=np.int64)
+    np.add.at(binned, idx, counts)
+    samples = binned.sum(axis=1)
+    dominant = binned.argmax(axis=1)
+    positive = binned[:, POSITIVE].sum(axis=1) / samples
+    negative = binned[:, NEGATIVE].sum(axis=1) / samples
+    return [
+        {
+            't': int(t),
+            'samples': int(n),
+            'dominant': EMOTION_LABELS[d].capitalize(),
+            'positive_ratio': round(float(pos), 4),
+            'negative_ratio': round(float(neg), 4),
+            'counts': {label: int(c) for label, c in zip(EMOTION_LABELS, row) if c},
+        }
+        for t, n, d, pos, neg, row in zip(points, samples, dominant, positive, negative, binned)
+    ]
+
+
+def session_timeline(user_id, conversation_id, source=None, resolution=60):
+    """
+    Per-session emotion timeline re-bucketed to `resolution` seconds, plus session aggregates.
+    """
+    filters = [EmotionBucket.user_id == user_id, EmotionBucket.conversation_id == conversation_id]
+    if source:
+        filters.append(EmotionBucket.source == source)
+    starts, _, counts = _load_buckets(filters)
+
+    return {'resolution': resolution, 'timeline': _bin_timeline(starts, counts, resolution),
+            'aggregate': _aggregate(counts)}
+
+
+def user_summary(user_id, source=None, resolution=3600):
+    """
+    Per-user timeline across all sessions re-bucketed to `resolution` seconds, plus aggregates
+    overall and per conversation (one grouped pass, no per-session queries).
+    """
+    filters = [EmotionBucket.user_id == user_id]
+    if source:
+        filters.append(EmotionBucket.source == source)
+    starts, conversation_ids, counts = _load_buckets(filters)
+
+    sessions = []
+    if starts.size:
+        ids, idx = np.unique(conversation_ids, return_inverse=True)
+        per_session = np.zeros((len(ids), len(EMOTION_LABELS)), dtype=np.int64)
+        np.add.at(per_session, idx, counts)
+        first = np.full(len(ids), np.iinfo(np.int64).max)
+        last = np.zeros(len(ids), dtype=np.int64)
+        np.minimum.at(first, idx, starts)
+        np.maximum.at(last, idx, starts)
+        for conversation_id, row, t0, t1 in zip(ids, per_session, first, last):
+            sessions.append({
+                'conversation_id': int(conversation_id) if conversation_id >= 0 else None,
+                'first_bucket': int(t0),
+                'last_bucket': int(t1),
+                **_aggregate(row[np.newaxis, :]),
+            })
+
+    return {'resolution': resolution, 'timeline': _bin_timeline(starts, counts, resolution),
+            'aggregate': _aggregate(counts), 'sessions': sessions}
+
+
+# Global instance for Flask application use
+emotion_telemetry = EmotionTelemetry()
@@ -1,12 +1,13 @@
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import BaseMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_groq import ChatGroq
+from metrics import timed, count_fallback
 
 # Load environment variables (needed to ensure GROQ_API_KEY is available)
 load_dotenv() 
@@ -20,6 +21,8 @@ class LLM_Chatbot:
         self.chain = self._build_chain()
         # In-memory history store, keyed by conversation_id
         self.history_store: Dict[str, ChatMessageHistory] = {}
+        # Turns committed per conversation, bumped by commit_turn()
+        self.history_versions: Dict[str, int] = {}
         
         if not os.environ.get("GROQ_API_KEY"):
             print("WARNING: GROQ_API_KEY not found. Using generic fallback.")
@@ -101,40 +104,74 @@ class LLM_Chatbot:
             self.history_store[session_id] = ChatMessageHistory()
         return self.history_store[session_id]
 
-    def get_response(self, conversation_id: int, user_message: str, user_data: Dict[str, Any]) -> str:
+    def history_snapshot(self, conversation_id: int) -> List[BaseMessage]:
+        """Copy of the messages currently held for a conversation."""
+        return list(self._get_session_history(str(conversation_id)).messages)
+
+    def history_version(self, conversation_id: int) -> int:
+        """Number of turns committed to a conversation's history (used to detect stale speculations)."""
+        return self.history_versions.get(str(conversation_id), 0)
+
+    def generate(self, conversation_id: int, user_message: str, user_data: Dict[str, Any],
+                 history_messages: Optional[List[BaseMessage]] = None) -> str:
         """
-        Main call function to get an LLM response.
+        Runs the LLM for one turn WITHOUT touching the stored history. Raises on API errors.
         """
-        session_id = str(conversation_id)
-        
+        if history_messages is None:
+            history_messages = self.history_snapshot(conversation_id)
+
         system_text = self._generate_system_prompt(user_data)
         system_message_lc = SystemMessage(content=system_text)
-        history = self._get_session_history(session_id)
 
-        # 1. Add current user message to history
-        history.add_user_message(user_message)
-
-        try:
-            # 2. Invoke the chain
-            result = self.chain.invoke(
+        with timed('llm_call'):
+            return self.chain.invoke(
                 {
                     "input": user_message,
                     "system_message": [system_message_lc],
-                    "history": history.messages[:-1] # Send all *previous* messages
+                    "history": history_messages # Send all *previous* messages
                 },
                 config={}
             )
-            ai_text = result
+
+    def commit_turn(self, conversation_id: int, user_message: str, ai_text: str) -> None:
+        """Appends a finished user/AI exchange to the in-memory history and trims it."""
+        session_id = str(conversation_id)
+        history = self._get_session_history(session_id)
+        history.add_user_message(user_message)
+        history.add_ai_message(ai_text)
+        self._trim_history_buffer(history)
+        self.history_versions[session_id] = self.history_versions.get(session_id, 0) + 1
+
+    def get_response(self, conversation_id: int, user_message: str, user_data: Dict[str, Any]) -> str:
+        """
+        Main call function to get an LLM response.
+        """
+        try:
+            # 1. Invoke the chain on the current history
+            ai_text = self.generate(conversation_id, user_message, user_data)
         except Exception as e:
             print(f"Groq/LangChain API Error: {e}")
+            count_fallback('llm_api_error')
             ai_text = f"I apologize, {user_data.get('username', 'Learner')}, I'm currently unable to access my knowledge base."
 
-        # 3. Add AI response to history and trim
-        history.add_ai_message(ai_text)
-        self._trim_history_buffer(history)
-        
+        # 2. Add user message and AI response to history and trim
+        self.commit_turn(conversation_id, user_message, ai_text)
+
         return ai_text
 
+    def summarize_session(self, transcript: str) -> str:
+        """Summarizes a full session transcript. Raises on API errors (callers retry)."""
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", "You summarize tutoring sessions between a student and a Virtual Teaching Assistant. "
+                           "In under 200 words, list the topics covered, what the student struggled with "
+                           "(including their detected emotions), and suggested next steps. Use Markdown bullet points."),
+                ("human", "{transcript}"),
+            ]
+        )
+        with timed('llm_summary'):
+            return (prompt | self.llm | StrOutputParser()).invoke({"transcript": transcript})
+
     def _trim_history_buffer(self, history: ChatMessageHistory, max_messages: int = MAX_HISTORY_MESSAGES) -> None:
         """Keeps only the most recent N messages in memory."""
         if len(history.messages) > max_messages:
@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import base64
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from metrics import REGISTRY, timed
+
+# --- CONFIGURATION ---
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jobs.db'))
+JOB_POOLS = {
+    'default': int(os.environ.get('JOB_WORKERS', '2')),       # summaries, large audio clips
+    'bulk': int(os.environ.get('JOB_BULK_WORKERS', '1')),     # exports and other long batch work
+}
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2.0  # seconds, doubled per attempt
+# Finished (done/failed) jobs are deleted after this long; their payloads are dropped as soon as they finish
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION_SECONDS', str(24 * 3600)))
+PURGE_INTERVAL = 3600.0  # seconds between purges of expired jobs
+FINISHED_STATUSES = ('done', 'failed')
+
+# Lower value = runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+JOBS_TOTAL = REGISTRY.counter('evta_jobs_total', 'Background jobs by kind and outcome.')
+
+
+# --- PAYLOAD ENCODING (JSON + bytes, so audio blobs survive a restart) ---
+
+def _encode(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'__bytes__': base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__bytes__'}:
+            return base64.b64decode(value['__bytes__'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'payload', 'priority', 'pool', 'user_id', 'sid', 'result_event',
+                 'status', 'attempts', 'max_retries', 'result', 'error', 'created_at', 'updated_at')
+
+    def __init__(self, kind, payload, priority=PRIORITY_NORMAL, pool='default', user_id=None, sid=None,
+                 result_event='job_result', max_retries=MAX_RETRIES, id=None, status='queued', attempts=0,
+                 result=None, error=None, created_at=None, updated_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload
+        self.priority = priority
+        self.pool = pool
+        self.user_id = user_id
+        self.sid = sid
+        self.result_event = result_event
+        self.status = status  # queued | running | done | failed
+        self.attempts = attempts
+        self.max_retries = max_retries
+        self.result = result
+        self.error = error
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    def to_dict(self):
+        """Public view of the job (no payload) for status endpoints and Socket.IO events."""
+        return {
+            'job_id': self.id, 'kind': self.kind, 'status': self.status, 'attempts': self.attempts,
+            'result': self.result, 'error': self.error,
+            'created_at': self.created_at, 'updated_at': self.updated_at,
+        }
+
+
+class SQLiteJobStore:
+    """
+    Local persistent backend: every state change is written so queued/running jobs survive a restart.
+    The payload is written once on insert; state changes only update the status columns.
+    """
+
+    COLUMNS = ('id', 'kind', 'payload', 'priority', 'pool', 'user_id', 'sid', 'result_event',
+               'status', 'attempts', 'max_retries', 'result', 'error', 'created_at', 'updated_at')
+
+    def __init__(self, path=JOB_DB_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT, priority INTEGER NOT NULL, '
+                'pool TEXT NOT NULL, user_id INTEGER, sid TEXT, result_event TEXT, status TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL, max_retries INTEGER NOT NULL, result TEXT, error TEXT, '
+                'created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status)')
+
+    def save(self, job):
+        row = (job.id, job.kind, json.dumps(_encode(job.payload)), job.priority, job.pool, job.user_id, job.sid,
+               job.result_event, job.status, job.attempts, job.max_retries, json.dumps(_encode(job.result)), job.error,
+               job.created_at, job.updated_at)
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) "
+                               f"VALUES ({', '.join('?' * len(self.COLUMNS))})", row)
+
+    def update(self, job):
+        """Writes a state change without re-serializing the payload; finished jobs drop theirs."""
+        clear_payload = ', payload = NULL' if job.status in FINISHED_STATUSES else ''
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET status = ?, attempts = ?, result = ?, error = ?, updated_at = ?"
+                               f"{clear_payload} WHERE id = ?",
+                               (job.status, job.attempts, json.dumps(_encode(job.result)), job.error,
+                                job.updated_at, job.id))
+
+    def _to_job(self, row):
+        data = dict(zip(self.COLUMNS, row))
+        data['payload'] = _decode(json.loads(data['payload'])) if data['payload'] else None
+        data['result'] = _decode(json.loads(data['result'])) if data['result'] else None
+        return Job(**data)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs "
+                                      f"WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def purge_finished(self, older_than):
+        """Deletes jobs that finished more than `older_than` seconds ago. Returns the deleted jobs."""
+        cutoff = time.time() - older_than
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs "
+                                      f"WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)).fetchall()
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+        return [self._to_job(row) for row in rows]
+
+
+class JobQueue:
+    """
+    In-process job queue: named worker pools, each draining its own priority heap.
+    Handlers run inside the Flask app context; failures are retried with exponential backoff.
+    `on_finish(job)` is called after a job is done or has failed for good (used to emit
+    the result to the client over Socket.IO). `on_purge(jobs)` is called after every purge
+    with the deleted jobs (used to delete the files they produced).
+    """
+
+    def __init__(self, store=None, pools=None, retention=JOB_RETENTION):
+        self.store = store
+        self.pools = dict(pools or JOB_POOLS)
+        self.retention = retention
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self.app = None
+        self.on_finish: Optional[Callable[[Job], None]] = None
+        self.on_purge: Optional[Callable[[List[Job]], None]] = None
+        self._heaps = {pool: [] for pool in self.pools}
+        self._conditions = {pool: threading.Condition() for pool in self.pools}
+        self._seq = 0
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def start(self, app, on_finish=None, on_purge=None):
+        """
+        Starts the worker threads and re-queues jobs left unfinished by a previous process.
+        Finished jobs older than `retention` are purged now and every PURGE_INTERVAL seconds.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            self.app = app
+            self.on_finish = on_finish
+            self.on_purge = on_purge
+            if self.store is None:
+                self.store = SQLiteJobStore()
+            for job in self.store.unfinished():
+                job.status = 'queued'
+                self._push(job)
+            for pool, workers in self.pools.items():
+                for i in range(workers):
+                    threading.Thread(target=self._worker, args=(pool,), name=f"job-{pool}-{i}", daemon=True).start()
+            threading.Thread(target=self._purger, name="job-purger", daemon=True).start()
+            self._started = True
+
+    def enqueue(self, kind, payload, priority=PRIORITY_NORMAL, pool='default', user_id=None, sid=None,
+                result_event='job_result', max_retries=MAX_RETRIES):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        if pool not in self.pools:
+            raise ValueError(f"Unknown worker pool '{pool}'")
+        job = Job(kind, payload, priority, pool, user_id, sid, result_event, max_retries)
+        self.store.save(job)
+        self._push(job)
+        JOBS_TOTAL.inc(kind=kind, outcome='enqueued')
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def depth(self, pool='default'):
+        """Jobs waiting in a pool (not counting running ones)."""
+        return len(self._heaps.get(pool, ()))
+
+    def _push(self, job):
+        condition = self._conditions[job.pool]
+        with condition:
+            self._seq += 1
+            heapq.heappush(self._heaps[job.pool], (job.priority, self._seq, job))
+            condition.notify()
+
+    def _worker(self, pool):
+        condition = self._conditions[pool]
+        heap = self._heaps[pool]
+        while True:
+            with condition:
+                while not heap:
+                    condition.wait()
+                _, _, job = heapq.heappop(heap)
+            try:
+                self._run(job)
+            except Exception as e:
+                # Never let a bookkeeping failure (e.g. the store) kill the worker thread
+                print(f"Job worker '{pool}' error on job {job.id}: {e}")
+
+    def _purger(self):
+        while True:
+            try:
+                purged = self.store.purge_finished(self.retention)
+                if purged:
+                    print(f"Purged {len(purged)} finished job(s) older than {self.retention:.0f}s")
+                if self.on_purge:
+                    self.on_purge(purged)
+            except Exception as e:
+                print(f"Purging finished jobs failed: {e}")
+            time.sleep(PURGE_INTERVAL)
+
+    def _run(self, job):
+        job.status = 'running'
+        job.attempts += 1
+        job.updated_at = time.time()
+        self.store.update(job)
+
+        try:
+            with self.app.app_context(), timed(f"job_{job.kind}"):
+                job.result = self.handlers[job.kind](job.payload)
+            job.status = 'done'
+            job.error = None
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}: {e}")
+            job.error = str(e)
+            if job.attempts <= job.max_retries:
+                job.status = 'queued'
+                job.updated_at = time.time()
+                self.store.update(job)
+                JOBS_TOTAL.inc(kind=job.kind, outcome='retried')
+                delay = RETRY_BACKOFF * (2 ** (job.attempts - 1))
+                timer = threading.Timer(delay, self._push, args=(job,))
+                timer.daemon = True
+                timer.start()
+                return
+            job.status = 'failed'
+
+        # The payload (e.g. a student's recording) is not needed once the job has finished
+        job.payload = None
+        job.updated_at = time.time()
+        self.store.update(job)
+        JOBS_TOTAL.inc(kind=job.kind, outcome=job.status)
+        if self.on_finish:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"Delivering job {job.id} result failed: {e}")
+
+
+# Global instance for Flask application use (started by app.py)
+job_queue = JobQueue()
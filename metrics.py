@@ -0,0 +1,284 @@
+import os
+import sys
+import time
+import random
+import threading
+import traceback
+from collections import Counter as _FrameCounter, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# --- CONFIGURATION ---
+# Latency buckets (seconds) for stage histograms: sub-ms decode steps up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Optional sampling profiler: fraction of requests to profile (0 disables), and sample interval
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.005'))  # seconds
+MAX_STORED_PROFILES = 20
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    """Monotonic counter, one value per label set."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Value that can go up and down (e.g. in-flight work), one value per label set."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics), one series per label set."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', repr(float(bound)))])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text=''):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text=''):
+        return self._get_or_create(Histogram, name, help_text)
+
+    def render(self):
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+
+# --- GLOBAL REGISTRY AND STANDARD METRICS ---
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram('evta_stage_duration_seconds', 'Time spent in each hot-path stage.')
+EVENT_SECONDS = REGISTRY.histogram('evta_event_duration_seconds', 'End-to-end time per request or Socket.IO event.')
+EVENTS_TOTAL = REGISTRY.counter('evta_events_total', 'Requests and Socket.IO events handled.')
+ERRORS_TOTAL = REGISTRY.counter('evta_errors_total', 'Exceptions raised inside a hot-path stage.')
+FALLBACKS_TOTAL = REGISTRY.counter('evta_fallbacks_total', 'Degraded responses returned instead of a real result.')
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def count_error(stage):
+    ERRORS_TOTAL.inc(stage=stage)
+
+
+def count_fallback(kind):
+    FALLBACKS_TOTAL.inc(kind=kind)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Context manager timing one stage into `evta_stage_duration_seconds{stage=...}`.
+    Exceptions are counted in `evta_errors_total` and re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count_error(stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed_event(event):
+    """
+    Decorator timing a whole Flask view or Socket.IO handler into `evta_event_duration_seconds`.
+    A PROFILE_SAMPLE_RATE fraction of calls is also run under the sampling profiler.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            EVENTS_TOTAL.inc(event=event)
+            profiler = start_profile(event) if should_profile() else None
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                EVENT_SECONDS.observe(time.perf_counter() - start, event=event)
+                if profiler:
+                    finish_profile(profiler)
+        return wrapper
+    return decorator
+
+
+# --- OPTIONAL SAMPLING PROFILER ---
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for ONE thread (the request thread).
+    A daemon thread snapshots the target thread's stack every `interval` seconds via
+    sys._current_frames() and counts collapsed stacks ("a;b;c" -> samples).
+    """
+
+    def __init__(self, label, interval=PROFILE_INTERVAL, thread_id=None):
+        self.label = label
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = _FrameCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started_at = None
+        self.duration = 0.0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            collapsed = ';'.join(f"{os.path.basename(fs.filename)}:{fs.name}" for fs in stack)
+            self.stacks[collapsed] += 1
+            self.samples += 1
+
+    def start(self):
+        self.started_at = time.time()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.label}", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        self.duration = time.time() - self.started_at
+        return self
+
+    def to_dict(self, top=25):
+        return {
+            'label': self.label,
+            'started_at': self.started_at,
+            'duration_s': self.duration,
+            'samples': self.samples,
+            'interval_s': self.interval,
+            'top_stacks': [{'stack': s, 'samples': n} for s, n in self.stacks.most_common(top)],
+        }
+
+
+RECENT_PROFILES = deque(maxlen=MAX_STORED_PROFILES)
+
+
+def should_profile():
+    """True if this call was randomly picked for profiling at PROFILE_SAMPLE_RATE."""
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile(label):
+    return SamplingProfiler(label).start()
+
+
+def finish_profile(profiler):
+    RECENT_PROFILES.append(profiler.stop().to_dict())
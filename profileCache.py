@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from metrics import REGISTRY
+
+# --- CONFIGURATION ---
+PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get('PROFILE_CACHE_MAX_ENTRIES', '10000'))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '600'))  # safety net; PUT /api/profile invalidates
+
+PROFILE_CACHE_EVENTS = REGISTRY.counter('evta_profile_cache_total', 'Profile cache lookups by outcome.')
+
+
+class CachedProfile:
+    """Parsed preferences plus the profile part of the chatbot prompt inputs, built once per change."""
+
+    __slots__ = ('user_id', 'likes', 'dislikes', 'context', 'prompt_inputs', 'expires_at')
+
+    def __init__(self, user, likes, dislikes, ttl):
+        self.user_id = user.id
+        self.likes = likes
+        self.dislikes = dislikes
+        self.context = user.context
+        # Same defaults chat_message has always used for the system prompt
+        self.prompt_inputs = {
+            'username': user.username,
+            'context': user.context if user.context else "a student",
+            'likes': ', '.join(likes),
+        }
+        self.expires_at = time.monotonic() + ttl
+
+
+class ProfileCache:
+    """Per-user LRU cache of CachedProfile entries. Must be invalidated whenever a profile is written."""
+
+    def __init__(self, max_entries=PROFILE_CACHE_MAX_ENTRIES, ttl=PROFILE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> CachedProfile
+        self._lock = threading.Lock()
+
+    def get(self, user):
+        with self._lock:
+            entry = self._entries.get(user.id)
+            if entry is not None and entry.expires_at >= time.monotonic():
+                self._entries.move_to_end(user.id)
+                PROFILE_CACHE_EVENTS.inc(outcome='hit')
+                return entry
+
+        PROFILE_CACHE_EVENTS.inc(outcome='miss')
+        entry = CachedProfile(user, user.get_preferences('like'), user.get_preferences('dislike'), self.ttl)
+        with self._lock:
+            self._entries[user.id] = entry
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+# Global instance for Flask application use
+profile_cache = ProfileCache()
@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+# --- CONFIGURATION ---
+# Set RATE_LIMITING=0 to admit everything (in-flight load is still tracked), e.g. for benchmarks
+RATE_LIMITING = os.environ.get('RATE_LIMITING', '1') == '1'
+
+# Per event type:
+#   key_rate/key_burst        token bucket per Socket.IO session (streams) or per user (chat)
+#   global_rate/global_burst  token bucket shared by all clients
+#   downsample_at             in-flight load at which only every DOWNSAMPLE_EVERY-th event per key runs (None = never)
+#   shed_at                   in-flight load at which new events are rejected outright
+RATE_LIMITS = {
+    # The client sends one frame every 2s; allow some slack for reconnect bursts
+    'video_stream': dict(key_rate=1.0, key_burst=3, global_rate=100.0, global_burst=200, downsample_at=8, shed_at=32),
+    'audio_stream': dict(key_rate=0.5, key_burst=3, global_rate=20.0, global_burst=40, downsample_at=None, shed_at=8),
+    'chat_message': dict(key_rate=0.5, key_burst=5, global_rate=20.0, global_burst=40, downsample_at=None, shed_at=16),
+}
+DOWNSAMPLE_EVERY = 3
+MAX_TRACKED_KEYS = 10000
+
+# Admission decisions
+ADMITTED = 'admitted'
+THROTTLED = 'throttled'        # this client is over its rate
+THROTTLED_GLOBAL = 'throttled_global'  # all clients together are over the global rate
+DOWNSAMPLED = 'downsampled'    # skipped to reduce load; caller serves a cheap/cached answer
+SHED = 'shed'                  # server is overloaded
+
+ADMISSION_TOTAL = REGISTRY.counter('evta_admission_total', 'Admission decisions per event type.')
+IN_FLIGHT = REGISTRY.gauge('evta_in_flight', 'Events currently being processed, per event type.')
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/second refill, at most `burst` tokens stored."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def consume(self, tokens=1.0):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def retry_after(self, tokens=1.0):
+        """Seconds until `tokens` will be available."""
+        return max(0.0, (tokens - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+
+
+class AdmissionControl:
+    """
+    Per-key and global rate limiting plus load-aware shedding/downsampling for the real-time events.
+    Load = events of that type currently in flight (+ optional extra load, e.g. queued jobs).
+    """
+
+    def __init__(self, limits=None, enabled=RATE_LIMITING):
+        self.limits = limits or RATE_LIMITS
+        self.enabled = enabled
+        self._key_buckets = OrderedDict()  # (event, key) -> TokenBucket, LRU-bounded
+        self._global_buckets = {event: TokenBucket(cfg['global_rate'], cfg['global_burst'])
+                                for event, cfg in self.limits.items()}
+        self._in_flight = {event: 0 for event in self.limits}
+        self._skip_counters = {}
+        self._extra_load = {}
+        self._lock = threading.Lock()
+
+    def add_load_source(self, event, source):
+        """Registers a callable whose value is added to the event's in-flight load (e.g. a queue depth)."""
+        self._extra_load[event] = source
+
+    def load(self, event):
+        extra = self._extra_load.get(event)
+        return self._in_flight[event] + (extra() if extra else 0)
+
+    def _key_bucket(self, event, key, cfg):
+        bucket_key = (event, key)
+        bucket = self._key_buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._key_buckets[bucket_key] = TokenBucket(cfg['key_rate'], cfg['key_burst'])
+            while len(self._key_buckets) > MAX_TRACKED_KEYS:
+                self._key_buckets.popitem(last=False)
+        else:
+            self._key_buckets.move_to_end(bucket_key)
+        return bucket
+
+    def _decide(self, event, key):
+        cfg = self.limits[event]
+        load = self.load(event)
+        with self._lock:
+            if not self.enabled:
+                self._in_flight[event] += 1
+                IN_FLIGHT.inc(event=event)
+                return ADMITTED
+            if not self._key_bucket(event, key, cfg).consume():
+                return THROTTLED
+            if load >= cfg['shed_at']:
+                return SHED
+            if cfg['downsample_at'] is not None and load >= cfg['downsample_at']:
+                skip_key = (event, key)
+                count = self._skip_counters.get(skip_key, 0) + 1
+                self._skip_counters[skip_key] = count
+                if count % DOWNSAMPLE_EVERY:
+                    return DOWNSAMPLED
+            if not self._global_buckets[event].consume():
+                return THROTTLED_GLOBAL
+            self._in_flight[event] += 1
+        IN_FLIGHT.inc(event=event)
+        return ADMITTED
+
+    @contextmanager
+    def admit(self, event, key):
+        """
+        Yields the admission decision; the caller only does the real work if it is ADMITTED.
+        Admitted events count as in-flight load until the block exits.
+        """
+        decision = self._decide(event, key)
+        ADMISSION_TOTAL.inc(event=event, decision=decision)
+        try:
+            yield decision
+        finally:
+            if decision == ADMITTED:
+                with self._lock:
+                    self._in_flight[event] -= 1
+                IN_FLIGHT.dec(event=event)
+
+    def retry_after(self, event, key):
+        """Seconds a throttled client should wait before retrying."""
+        with self._lock:
+            bucket = self._key_buckets.get((event, key))
+            return bucket.retry_after() if bucket else 0.0
+
+    def forget(self, key):
+        """Drops per-key state (e.g. when a Socket.IO client disconnects)."""
+        with self._lock:
+            for event in self.limits:
+                self._key_buckets.pop((event, key), None)
+                self._skip_counters.pop((event, key), None)
+
+
+# Global instance for Flask application use
+admission_control = AdmissionControl()
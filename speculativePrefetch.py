@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from metrics import REGISTRY
+
+# --- CONFIGURATION ---
+# Opt-in: start the LLM call as soon as a voice transcription is produced
+SPECULATIVE_PREFETCH = os.environ.get('SPECULATIVE_PREFETCH', '0') == '1'
+SPECULATIVE_MAX_CONCURRENT = int(os.environ.get('SPECULATIVE_MAX_CONCURRENT', '4'))
+SPECULATIVE_TTL = float(os.environ.get('SPECULATIVE_TTL', '120'))  # seconds a result is held
+SPECULATIVE_WAIT = float(os.environ.get('SPECULATIVE_WAIT', '60'))  # max wait for a still-running match
+
+SPECULATIONS_TOTAL = REGISTRY.counter('evta_speculative_llm_total', 'Speculative LLM generations by outcome.')
+SPECULATIVE_WASTED_CHARS = REGISTRY.counter('evta_speculative_llm_wasted_chars_total',
+                                            'Characters generated by speculative LLM calls that were discarded.')
+
+
+def normalize_text(text):
+    return ' '.join(str(text).split())
+
+
+def is_candidate(transcription):
+    """Same rule the frontend uses to auto-send a transcription (see audio_response in index.html)."""
+    return len(transcription) > 5 and 'Error' not in transcription and 'placeholder' not in transcription
+
+
+class Speculation:
+    __slots__ = ('key', 'user_data', 'history_version', 'future', 'created_at')
+
+    def __init__(self, key, user_data, history_version, future):
+        self.key = key
+        self.user_data = user_data
+        self.history_version = history_version
+        self.future = future
+        self.created_at = time.monotonic()
+
+
+class SpeculativePrefetcher:
+    """
+    Holds at most one speculative LLM generation per conversation, keyed by
+    (conversation, normalized text, emotion). claim() serves it only if the submitted
+    message, emotion, profile data and conversation history all still match; anything
+    else is discarded. Speculative calls never touch the chatbot's stored history
+    until they are claimed.
+    """
+
+    def __init__(self, chatbot, enabled=SPECULATIVE_PREFETCH, max_concurrent=SPECULATIVE_MAX_CONCURRENT,
+                 ttl=SPECULATIVE_TTL):
+        self.chatbot = chatbot
+        self.enabled = enabled
+        self.ttl = ttl
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='speculative-llm') \
+            if enabled else None
+        self._speculations: Dict[int, Speculation] = {}  # conversation_id -> Speculation
+        self._lock = threading.Lock()
+
+    def speculate(self, conversation_id: int, text: str, user_data: Dict[str, Any]) -> bool:
+        """Starts a speculative generation. Returns False if disabled, duplicate or over the concurrency limit."""
+        if not self.enabled:
+            return False
+        key = (conversation_id, normalize_text(text), user_data.get('voice_emotion'))
+
+        with self._lock:
+            self._sweep_expired()
+            current = self._speculations.get(conversation_id)
+            if current is not None and current.key == key and not self._expired(current):
+                return False
+            if not self._slots.acquire(blocking=False):
+                SPECULATIONS_TOTAL.inc(outcome='rejected')
+                return False
+            if current is not None:
+                self._discard(current, 'superseded')
+
+            history_version = self.chatbot.history_version(conversation_id)
+            history_messages = self.chatbot.history_snapshot(conversation_id)
+            future = self._executor.submit(self._run, conversation_id, text, dict(user_data), history_messages)
+            self._speculations[conversation_id] = Speculation(key, dict(user_data), history_version, future)
+
+        SPECULATIONS_TOTAL.inc(outcome='started')
+        return True
+
+    def _run(self, conversation_id, text, user_data, history_messages):
+        try:
+            return self.chatbot.generate(conversation_id, text, user_data, history_messages)
+        finally:
+            self._slots.release()
+
+    def claim(self, conversation_id: int, text: str, user_data: Dict[str, Any]) -> Optional[str]:
+        """
+        Returns the speculative reply for this exact turn (and commits it to the chat history),
+        or None if there is no usable speculation — the caller then makes the normal LLM call.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._sweep_expired()
+            speculation = self._speculations.pop(conversation_id, None)
+        if speculation is None:
+            return None
+
+        key = (conversation_id, normalize_text(text), user_data.get('voice_emotion'))
+        if speculation.key != key or speculation.user_data != user_data:
+            self._discard(speculation, 'mismatch')
+            return None
+        if speculation.history_version != self.chatbot.history_version(conversation_id):
+            self._discard(speculation, 'stale_history')
+            return None
+        if self._expired(speculation):
+            self._discard(speculation, 'expired')
+            return None
+
+        try:
+            ai_text = speculation.future.result(timeout=SPECULATIVE_WAIT)
+        except Exception as e:
+            print(f"Speculative LLM generation failed: {e}")
+            SPECULATIONS_TOTAL.inc(outcome='error')
+            return None
+        if not ai_text or ai_text.isspace():
+            SPECULATIONS_TOTAL.inc(outcome='error')
+            return None
+
+        self.chatbot.commit_turn(conversation_id, text, ai_text)
+        SPECULATIONS_TOTAL.inc(outcome='hit')
+        return ai_text
+
+    def _expired(self, speculation):
+        return time.monotonic() - speculation.created_at > self.ttl
+
+    def _sweep_expired(self):
+        """Discards held speculations whose chat turn never arrived (caller holds the lock)."""
+        expired = [cid for cid, speculation in self._speculations.items() if self._expired(speculation)]
+        for conversation_id in expired:
+            self._discard(self._speculations.pop(conversation_id), 'expired')
+
+    def _discard(self, speculation, reason):
+        SPECULATIONS_TOTAL.inc(outcome=f'discarded_{reason}')
+        # The call cannot be aborted once running; account for what it produced when it finishes
+        speculation.future.add_done_callback(
+            lambda f: SPECULATIVE_WASTED_CHARS.inc(len(f.result() or '')) if not f.exception() else None
+        )